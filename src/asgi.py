@@ -0,0 +1,203 @@
+"""
+    Asynchronous front end exposing the /games/start, /games/play and /games/moves contract of controller.py
+    as an ASGI application
+
+    Slow clients are awaited on the event loop without holding a thread, engines run on a bounded thread pool and
+    requests are answered 503 once ASGI_MAX_PENDING of them are already waiting for it.
+
+    in `src/`
+
+        uvicorn asgi:APP --host 127.0.0.1 --port 8081
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from exceptions import GameIsOverException
+from serializers import loads
+from metrics import expose, slowest_requests
+from services import CODEC, start_game_request, play_move_body, game_over_response, error_payload, encode_json, \
+    legal_moves_request
+from settings import ENDPOINTS, ASGI_EXECUTOR_WORKERS, ASGI_MAX_PENDING, ASGI_MAX_BODY_SIZE, HOSTNAME, PORT
+
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+# header name (lower case) -> value
+Headers = Dict[bytes, bytes]
+Route = Callable[[bytes, Headers], Tuple[Dict[str, Any], int]]
+
+
+class _ClientDisconnected(Exception):
+    """
+        The client went away before sending its whole request, which is then neither handled nor answered
+    """
+
+
+def start(body: bytes, headers: Headers) -> Tuple[Dict[str, Any], int]:
+    return CODEC.dump_start_game_response(
+        start_game_request(CODEC.load_start_game_request(loads(body)))
+    ), 200
+
+
+def play(body: bytes, headers: Headers) -> Tuple[Dict[str, Any], int]:
+    if_match = headers.get(b'if-match')
+
+    return play_move_body(body, None if if_match is None else if_match.decode('latin-1')), 200
+
+
+def moves(body: bytes, headers: Headers) -> Tuple[Dict[str, Any], int]:
+    return CODEC.dump_legal_moves_response(
+        legal_moves_request(CODEC.load_legal_moves_request(loads(body)))
+    ), 200
+
+
+def handle(route: Route, body: bytes, headers: Headers) -> Tuple[Dict[str, Any], int]:
+    # same error mapping as controller.handle_exception
+    try:
+        return route(body, headers)
+    except GameIsOverException as e:
+        return CODEC.dump_play_move_response(game_over_response(e)), 200
+    except Exception as e:
+        return error_payload(e)
+
+
+ROUTES: Dict[str, Route] = {
+    ENDPOINTS.GAME_START.value: start,
+    ENDPOINTS.GAME_PLAY.value: play,
+    ENDPOINTS.GAME_MOVES.value: moves,
+}
+
+# GET routes answering plain text, cheap enough to run on the event loop
+TEXT_ROUTES: Dict[str, Callable[[], str]] = {
+    ENDPOINTS.METRICS.value: expose,
+    ENDPOINTS.METRICS_SLOWEST.value: slowest_requests,
+}
+
+
+class AsgiApp:
+
+    def __init__(self, workers: int = ASGI_EXECUTOR_WORKERS, max_pending: int = ASGI_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='engine')
+
+        return self._executor
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Dict[str, Any], receive: Receive, send: Send):
+        headers = dict(scope['headers'])
+        accepts_gzip = b'gzip' in headers.get(b'accept-encoding', b'')
+
+        text_route = TEXT_ROUTES.get(scope['path'])
+        if text_route is not None and scope['method'] == 'GET':
+            return await self._send_text(send, text_route())
+
+        route = ROUTES.get(scope['path'])
+        if route is None:
+            return await self._send_json(send, {'error': 'Not Found'}, 404, accepts_gzip)
+
+        if scope['method'] != 'POST':
+            return await self._send_json(send, {'error': 'Method Not Allowed'}, 405, accepts_gzip, [(b'allow', b'POST')])
+
+        try:
+            body = await self._read_body(receive)
+        except _ClientDisconnected:
+            return
+        if body is None:
+            return await self._send_json(send, {'error': 'Request Entity Too Large'}, 413, accepts_gzip)
+
+        # backpressure: rather than queueing without bound behind a saturated executor, tell the client to retry
+        if self._pending >= self.max_pending:
+            return await self._send_json(send, {'error': 'Server Busy'}, 503, accepts_gzip, [(b'retry-after', b'1')])
+
+        self._pending += 1
+        try:
+            payload, status = await asyncio.get_running_loop().run_in_executor(
+                self.executor, handle, route, body, headers
+            )
+        finally:
+            self._pending -= 1
+
+        await self._send_json(send, payload, status, accepts_gzip)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> Optional[bytes]:
+        """
+        :return: Optional[bytes], the body, None if larger than ASGI_MAX_BODY_SIZE
+
+        :raise _ClientDisconnected
+        """
+        chunks: List[bytes] = []
+        size = 0
+
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                # a truncated body must not be handled as if complete
+                raise _ClientDisconnected()
+
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > ASGI_MAX_BODY_SIZE:
+                return None
+            chunks.append(chunk)
+
+            if not message.get('more_body', False):
+                break
+
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _send_text(send: Send, text: str):
+        body = text.encode()
+        headers = [(b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(body)).encode())]
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _send_json(
+            send: Send,
+            payload: Dict[str, Any],
+            status: int,
+            accepts_gzip: bool,
+            extra_headers: Optional[List[Tuple[bytes, bytes]]] = None
+    ):
+        body, gzipped = encode_json(payload, accepts_gzip)
+
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if gzipped:
+            headers += [(b'content-encoding', b'gzip'), (b'vary', b'Accept-Encoding')]
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers + (extra_headers or [])})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+APP = AsgiApp()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(APP, host=HOSTNAME, port=PORT)
@@ -0,0 +1,58 @@
+"""
+    Cost of engines.board_validator.validate_board versus the number of quantum marks on the board
+
+    in `src/`
+
+        python -m benchmarks.board_validation
+"""
+import random
+import timeit
+
+from engines.board_validator import validate_board
+from facades import Board, Cell, Engine, Mark
+from settings import PLAYER_1, PLAYER_2
+
+REPEAT = 5
+
+
+def build_board(board_size: int, marks_count: int, seed: int = 0) -> Board:
+    """
+    Build a valid board holding marks_count quantum marks entangling random cells, without any cycle
+
+    :param board_size: int
+    :param marks_count: int, lower than board_size * board_size
+    :param seed: int
+
+    :return: Board
+    """
+    rng = random.Random(seed)
+    cells = [Cell([]) for _ in range(board_size * board_size)]
+
+    # each mark links a cell already entangled to a new one, keeping the entanglement graph a tree
+    order = list(range(len(cells)))
+    rng.shuffle(order)
+    for round_index in range(1, marks_count + 1):
+        mark = Mark(PLAYER_1 if round_index % 2 != 0 else PLAYER_2, round_index)
+        cells[order[rng.randrange(round_index)]].quantic_marks.append(mark)
+        cells[order[round_index]].quantic_marks.append(mark)
+
+    return Board(cells, board_size, None, Engine.CASE.value)
+
+
+def run():
+    print(f"{'board size':>10} {'marks':>6} {'us / board':>11} {'ns / mark':>10}")
+
+    for board_size in (3, 5, 9, 15, 25):
+        for marks_count in sorted({board_size * board_size // 4, board_size * board_size // 2, board_size * board_size - 1}):
+            if marks_count < 1:
+                continue
+
+            board = build_board(board_size, marks_count)
+            number = max(1, 20000 // marks_count)
+            best = min(timeit.repeat(lambda: validate_board(board), number=number, repeat=REPEAT)) / number
+
+            print(f'{board_size:>10} {marks_count:>6} {best * 1e6:>11.1f} {best * 1e9 / marks_count:>10.0f}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,253 @@
+"""
+    Latency (median / p99) and allocations of the engine operations and of a /games/play round trip through Flask,
+    over generated boards of increasing size and quantum marks density
+
+    in `src/`
+
+        python -m benchmarks.suite --output results.json
+        python -m benchmarks.suite --baseline results.json
+
+    the second form compares against results written by the first one and exits with status 1
+    when an operation got slower than --threshold
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import services
+from benchmarks.board_validation import build_board
+from controller import APP
+from engines.case_engine import CaseEngine
+from engines.cow_board import CopyOnWriteBoard
+from exceptions import GameIsOverException
+from facades import Board, CollapseMove, MarkMove, PlayMoveRequest, PlayMoveRequestSchema
+from serializers import dumps
+from signing import sign_board
+
+BOARD_SIZES = (3, 5, 7)
+DENSITIES = (0.25, 0.5, 1.0)
+# samples of each case: at least MIN_SAMPLES, going on until MIN_TIME seconds are spent or MAX_SAMPLES are taken
+MIN_SAMPLES = 200
+MAX_SAMPLES = 20000
+MIN_TIME = 0.2
+WARMUP = 20
+ALLOCATION_SAMPLES = 20
+THRESHOLD = 0.25
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(operation: Callable[[], Any], min_time: float = MIN_TIME) -> Dict[str, float]:
+    """
+    Time operation call by call then, in a separate pass so tracing does not skew timings, its memory peak
+
+    :param operation: Callable[[], Any]
+    :param min_time: float, seconds
+
+    :return: Dict[str, float], median_us, p99_us, samples and peak_alloc_bytes
+    """
+    for _ in range(WARMUP):
+        operation()
+
+    timings = []
+    started_at = time.perf_counter()
+    while len(timings) < MAX_SAMPLES and (len(timings) < MIN_SAMPLES or time.perf_counter() - started_at < min_time):
+        call_started_at = time.perf_counter_ns()
+        operation()
+        timings.append((time.perf_counter_ns() - call_started_at) / 1000)
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(ALLOCATION_SAMPLES):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        operation()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        'median_us': statistics.median(timings),
+        'p99_us': _percentile(timings, 0.99),
+        'samples': len(timings),
+        'peak_alloc_bytes': statistics.median(peaks),
+    }
+
+
+def _pending_board(engine: CaseEngine, board: Board) -> Optional[Board]:
+    # entangle two cells already linked through the (tree shaped) board: that closes a cycle
+    entangled = [i for i, cell in enumerate(board.cells) if cell.quantic_marks]
+    if len(entangled) < 2:
+        return None
+
+    pending = CopyOnWriteBoard(board)
+    engine._update_board(MarkMove(entangled[0], entangled[-1]), pending)
+
+    return pending.board
+
+
+def _play(engine: CaseEngine, move, board: Board) -> Board:
+    try:
+        return engine.play_move(move, board, seed=0)
+    except GameIsOverException as e:
+        return e.board
+
+
+def _post(client, body: bytes) -> Callable[[], Any]:
+    def post():
+        response = client.post('/games/play', data=body)
+        if response.status_code != 200:
+            raise RuntimeError(f'/games/play answered {response.status_code}: {response.data!r}')
+
+    return post
+
+
+def cases(board_sizes=BOARD_SIZES, densities=DENSITIES) -> Iterator[Tuple[str, int, int, Callable[[], Any]]]:
+    """
+    :return: Iterator[Tuple[str, int, int, Callable[[], Any]]], name, board size, marks count and operation
+    """
+    client = APP.test_client()
+
+    for board_size in board_sizes:
+        engine = CaseEngine(board_size)
+        cells_count = board_size * board_size
+
+        for density in densities:
+            marks_count = max(1, int(density * (cells_count - 1)))
+            board = build_board(board_size, marks_count)
+            pending_board = _pending_board(engine, board)
+            # two cells entangled with nothing at low densities, any two cells otherwise
+            free = [i for i, cell in enumerate(board.cells) if not cell.quantic_marks] or list(range(cells_count))
+            move = MarkMove(free[0], free[-1] if len(free) > 1 else free[0] + 1)
+
+            def update_board_mark(board=board, move=move):
+                engine._update_board(move, CopyOnWriteBoard(board))
+
+            yield 'case_engine.update_board.mark', board_size, marks_count, update_board_mark
+            yield 'case_engine.get_winner', board_size, marks_count, lambda board=board: engine._get_winner(board)
+            yield 'base_engine.play_move', board_size, marks_count, lambda board=board, move=move: _play(
+                engine, move, board
+            )
+
+            request = PlayMoveRequest(move, None, board, sign_board(board))
+            yield 'http.play', board_size, marks_count, _post(client, dumps(PlayMoveRequestSchema.dump(request)))
+
+            if pending_board is None:
+                continue
+
+            selected_cell, other_cell = pending_board.cells_indexes_to_be_collapsed
+            collapse = CollapseMove(selected_cell)
+
+            def update_board_collapse(board=pending_board, collapse=collapse):
+                engine._update_board(collapse, CopyOnWriteBoard(board))
+
+            def propagate_collapse(board=pending_board, selected_cell=selected_cell, other_cell=other_cell):
+                pending = CopyOnWriteBoard(board)
+                initiating = max(pending.state.entangling_marks(selected_cell, other_cell))
+                engine._propagate_collapse(pending, pending.state.marks[initiating], selected_cell)
+
+            def play_collapse(board=pending_board, collapse=collapse):
+                return _play(engine, collapse, board)
+
+            yield 'case_engine.update_board.collapse', board_size, marks_count, update_board_collapse
+            yield 'case_engine.propagate_collapse', board_size, marks_count, propagate_collapse
+            yield 'base_engine.play_move.collapse', board_size, marks_count, play_collapse
+
+
+def case_key(result: Dict[str, Any]) -> str:
+    return f"{result['name']}[{result['board_size']}x{result['board_size']},{result['marks']}]"
+
+
+def run(min_time: float = MIN_TIME, board_sizes=BOARD_SIZES, densities=DENSITIES) -> Dict[str, Any]:
+    """
+    :return: Dict[str, Any], the machine readable results
+    """
+    # every round trip must play its move, not be answered from the play cache
+    cache_size, services.PLAY_CACHE.max_size = services.PLAY_CACHE.max_size, 0
+    try:
+        results = []
+        for name, board_size, marks_count, operation in cases(board_sizes, densities):
+            result = {'name': name, 'board_size': board_size, 'marks': marks_count, **measure(operation, min_time)}
+            results.append(result)
+            print(
+                f"{case_key(result):<50} {result['median_us']:>10.1f} {result['p99_us']:>10.1f} "
+                f"{result['peak_alloc_bytes'] / 1024:>9.1f}",
+                file=sys.stderr
+            )
+    finally:
+        services.PLAY_CACHE.max_size = cache_size
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = THRESHOLD) -> List[str]:
+    """
+    :param results: Dict[str, Any], as returned by run
+    :param baseline: Dict[str, Any], as returned by run
+    :param threshold: float, relative slow down of the median flagged as a regression
+
+    :return: List[str], keys of the regressed cases
+    """
+    baseline_medians = {case_key(result): result['median_us'] for result in baseline['results']}
+
+    regressions = []
+    print(f"{'case':<50} {'baseline':>10} {'median':>10} {'change':>8}")
+    for result in results['results']:
+        key = case_key(result)
+        if key not in baseline_medians:
+            continue
+
+        change = result['median_us'] / baseline_medians[key] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(key)
+
+        print(
+            f"{key:<50} {baseline_medians[key]:>10.1f} {result['median_us']:>10.1f} {change:>+8.0%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with the results of a previous run')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='seconds spent timing each case')
+    parser.add_argument('--board-sizes', type=int, nargs='+', default=BOARD_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'case':<50} {'median us':>10} {'p99 us':>10} {'peak KiB':>9}", file=sys.stderr)
+    results = run(args.min_time, args.board_sizes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) above {args.threshold:.0%}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
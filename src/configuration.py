@@ -1,6 +1,165 @@
-from engines.case_engine import CaseEngine
-from engines.dummy_engine import DummyEngine
-from settings import BOARD_SIZE
+"""
+    Engine registry: engines are imported and built on first use only, one instance per (engine, board size).
 
-CASE_ENGINE = CaseEngine(BOARD_SIZE)
-DUMMY_ENGINE = DummyEngine(BOARD_SIZE)
+    Engines are registered by name with register_engine, the built-in ones as entry points of their module, imported
+    by EntryPoint.load on first use. Other packages can provide an engine, under a new name or replacing a built-in
+    one, through an ENGINE_ENTRY_POINT_GROUP entry point, e.g. in their pyproject.toml:
+
+        [project.entry-points."quantic_tictactoe.engines"]
+        MY_ENGINE = "my_package.engines:MyEngine"
+
+    or at runtime with register_engine, also usable as a decorator:
+
+        @register_engine('MY_ENGINE')
+        class MyEngine(CaseEngine):
+            ...
+
+    Engines are known by their name, a plain string: the Engine enum only names the built-in ones. A factory is called
+    with the board size and returns a BaseEngine.
+"""
+from importlib.metadata import EntryPoint, entry_points
+from threading import RLock
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from engines.base_engine import BaseEngine
+from exceptions import InvalidEngineException, InvalidBoardSizeException
+from facades import Engine
+from settings import BOARD_SIZE, MIN_BOARD_SIZE, MAX_BOARD_SIZE, ENGINE_ENTRY_POINT_GROUP
+
+EngineFactory = Callable[[int], BaseEngine]
+
+# registered like the engines of other packages, before them
+_BUILT_IN_ENGINES = (
+    EntryPoint('DUMMY', 'engines.dummy_engine:DummyEngine', ENGINE_ENTRY_POINT_GROUP),
+    EntryPoint('CASE', 'engines.case_engine:CaseEngine', ENGINE_ENTRY_POINT_GROUP),
+    EntryPoint('MCTS', 'engines.mcts_engine:MctsEngine', ENGINE_ENTRY_POINT_GROUP),
+    EntryPoint('TABLE', 'engines.table_engine:TableEngine', ENGINE_ENTRY_POINT_GROUP),
+)
+# engine name -> factory, or the entry point of the factory until it is loaded
+_FACTORIES: Dict[str, Union[EntryPoint, EngineFactory]] = {}
+_entry_points_loaded = False
+
+# engines are stateless, one instance per (engine name, board size) is shared by every request
+_ENGINES: Dict[Tuple[str, int], BaseEngine] = {}
+# reentrant: loading an engine module may register engines
+_ENGINES_LOCK = RLock()
+
+
+def register_engine(
+        _type: Union[Engine, str],
+        factory: Optional[Union[EntryPoint, EngineFactory]] = None
+) -> Union[EngineFactory, Callable[[EngineFactory], EngineFactory]]:
+    """
+    Register (or replace) the factory of an engine, engines it already built being dropped
+
+    :param _type: Union[Engine, str], the engine name, or the built-in engine it replaces
+    :param factory: Optional[Union[EntryPoint, EngineFactory]], decorating the factory when None
+
+    :return: Union[EngineFactory, Callable[[EngineFactory], EngineFactory]], factory, or the decorator
+    """
+    if factory is None:
+        def decorator(decorated: EngineFactory) -> EngineFactory:
+            register_engine(_type, decorated)
+            return decorated
+
+        return decorator
+
+    with _ENGINES_LOCK:
+        # entry points must not override it later on
+        load_entry_points()
+        _register(_type, factory)
+
+    return factory
+
+
+def load_entry_points():
+    """
+    Register the engines other packages provide, once: scanning installed distributions costs a few milliseconds,
+    it is done on the first engine built (or the first engine name checked), not at import
+    """
+    global _entry_points_loaded
+
+    with _ENGINES_LOCK:
+        if _entry_points_loaded:
+            return
+
+        for entry_point in entry_points(group=ENGINE_ENTRY_POINT_GROUP):
+            _register(entry_point.name, entry_point)
+
+        _entry_points_loaded = True
+
+
+def engine_names() -> List[str]:
+    """
+    :return: List[str], the names of the registered engines, built-in ones first
+    """
+    load_entry_points()
+
+    return list(_FACTORIES)
+
+
+def is_engine_name(name: str) -> bool:
+    load_entry_points()
+
+    return name in _FACTORIES
+
+
+def _name(_type: Union[Engine, str]) -> str:
+    return _type.value if isinstance(_type, Engine) else _type
+
+
+def _register(_type: Union[Engine, str], factory: Union[EntryPoint, EngineFactory]):
+    _type = _name(_type)
+
+    _FACTORIES[_type] = factory
+    for key in [key for key in _ENGINES if key[0] == _type]:
+        del _ENGINES[key]
+
+
+def _get_factory(_type: str) -> EngineFactory:
+    factory = _FACTORIES.get(_type)
+    if factory is None:
+        raise InvalidEngineException()
+
+    if isinstance(factory, EntryPoint):
+        factory = _FACTORIES[_type] = factory.load()
+
+    return factory
+
+
+def get_engine(_type: Union[Engine, str], board_size: int = BOARD_SIZE) -> BaseEngine:
+    """
+    :param _type: Union[Engine, str], the engine name, or a built-in engine
+    :param board_size: int
+
+    :return: BaseEngine
+
+    :raise InvalidEngineException, InvalidBoardSizeException
+    """
+    _type = _name(_type)
+    if not isinstance(_type, str):
+        raise InvalidEngineException()
+
+    engine = _ENGINES.get((_type, board_size))
+    if engine is not None:
+        return engine
+
+    if not MIN_BOARD_SIZE <= board_size <= MAX_BOARD_SIZE:
+        raise InvalidBoardSizeException(f'board_size must be between {MIN_BOARD_SIZE} and {MAX_BOARD_SIZE}')
+
+    with _ENGINES_LOCK:
+        load_entry_points()
+
+        engine = _ENGINES.get((_type, board_size))
+        if engine is None:
+            engine = _get_factory(_type)(board_size)
+            # boards the engine starts carry the name it is registered under, a class registered under a new name
+            # inheriting the one of the engine it extends
+            engine._ENGINE = _type
+            _ENGINES[(_type, board_size)] = engine
+
+    return engine
+
+
+for _entry_point in _BUILT_IN_ENGINES:
+    _register(_entry_point.name, _entry_point)
@@ -1,60 +1,76 @@
-import json
+from flask import request, Blueprint, Flask, Response
 
-from flask import request, Blueprint, Flask, jsonify
-
-from configuration import CASE_ENGINE, DUMMY_ENGINE
-from engines.base_engine import BaseEngine
-from exceptions import InvalidEngineException, InvalidMoveException, GameIsOverException, InvalidBoardException
-from facades import PlayMoveRequestSchema, PlayMoveRequest, StartGameResponseSchema, StartGameResponse, \
-    PlayMoveResponseSchema, PlayMoveResponse, StartGameRequest, StartGameRequestSchema, Engine
-from settings import ENDPOINTS
+from exceptions import GameIsOverException, InvalidMoveException
+from facades import StartGameRequest
+from serializers import loads
+from metrics import expose, slowest_requests
+from services import CODEC, start_game_request, play_move_body, game_over_response, error_payload, \
+    play_move_batch, encode_json, legal_moves_request
+from settings import ENDPOINTS, BATCH_MAX_SIZE
 
 main_controller = Blueprint('main_controller', __name__)
 
 
-def get_engine(_type: Engine) -> BaseEngine:
-    if _type == Engine.DUMMY:
-        return DUMMY_ENGINE
-    elif _type == Engine.CASE:
-        return CASE_ENGINE
+def json_response(payload: dict, status: int = 200) -> Response:
+    body, gzipped = encode_json(payload, 'gzip' in request.accept_encodings)
+
+    response = Response(body, status=status, mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
 
-    raise InvalidEngineException()
+    return response
 
 
 @main_controller.route(ENDPOINTS.GAME_START.value, methods=['POST'])
 def start():
-    req: StartGameRequest = StartGameRequestSchema.load(json.loads(request.data))
+    req: StartGameRequest = CODEC.load_start_game_request(loads(request.data))
 
-    return jsonify(
-        StartGameResponseSchema.dump(
-            StartGameResponse(
-                get_engine(req.engine).start_game()
-            )
+    return json_response(
+        CODEC.dump_start_game_response(
+            start_game_request(req)
         )
     )
 
 
 @main_controller.route(ENDPOINTS.GAME_PLAY.value, methods=['POST'])
 def play():
-    req: PlayMoveRequest = PlayMoveRequestSchema.load(json.loads(request.data))
-
-    if req.collapse_move is None and req.mark_move is None:
-        return jsonify(
-            error=str('collapse_move and mark_move cannot both be null')
-        ), 400
-
-    return jsonify(
-        PlayMoveResponseSchema.dump(
-            PlayMoveResponse(
-                get_engine(req.previous_board.engine).play_move(
-                    req.mark_move or req.collapse_move, req.previous_board
-                ),
-                None
-            )
+    return json_response(
+        play_move_body(request.data, request.headers.get('If-Match'))
+    )
+
+
+@main_controller.route(ENDPOINTS.GAME_PLAY_BATCH.value, methods=['POST'])
+def play_batch():
+    requests = CODEC.load_play_move_batch_request(loads(request.data))
+
+    if len(requests) > BATCH_MAX_SIZE:
+        raise InvalidMoveException(f'A batch cannot hold more than {BATCH_MAX_SIZE} requests')
+
+    return json_response(
+        {'responses': play_move_batch(requests)}
+    )
+
+
+@main_controller.route(ENDPOINTS.GAME_MOVES.value, methods=['POST'])
+def moves():
+    return json_response(
+        CODEC.dump_legal_moves_response(
+            legal_moves_request(CODEC.load_legal_moves_request(loads(request.data)))
         )
     )
 
 
+@main_controller.route(ENDPOINTS.METRICS.value, methods=['GET'])
+def metrics():
+    return Response(expose(), mimetype='text/plain; version=0.0.4')
+
+
+@main_controller.route(ENDPOINTS.METRICS_SLOWEST.value, methods=['GET'])
+def metrics_slowest():
+    return Response(slowest_requests(), mimetype='text/plain')
+
+
 APP = Flask(__name__)
 
 APP.register_blueprint(main_controller)
@@ -62,31 +78,11 @@ APP.register_blueprint(main_controller)
 
 @APP.errorhandler(Exception)
 def handle_exception(e):
-    if isinstance(e, InvalidMoveException):
-        return jsonify(
-            error=str(e)
-        ), 400
-
-    if isinstance(e, InvalidEngineException):
-        return jsonify(
-            error=str(e)
-        ), 404
-
-    if isinstance(e, InvalidBoardException):
-        return jsonify(
-            error=str(e)
-        ), 404
-
     if isinstance(e, GameIsOverException):
-        return jsonify(
-            PlayMoveResponseSchema.dump(
-                PlayMoveResponse(
-                    e.board,
-                    e.winner_id
-                )
+        return json_response(
+            CODEC.dump_play_move_response(
+                game_over_response(e)
             )
-        ), 200
+        )
 
-    return jsonify(
-        error=f"Server Error: {str(e)}"
-    ), 500
+    return json_response(*error_payload(e))
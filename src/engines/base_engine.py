@@ -1,55 +1,155 @@
-from copy import deepcopy
-from random import randint, sample, choice
-from typing import Tuple, List, Union, Optional
+from random import Random
+from typing import Iterator, List, Union, Optional
 
-from exceptions import GameIsOverException
+from engines.bitboard import mask_cells
+from engines.cow_board import CopyOnWriteBoard
+from exceptions import GameIsOverException, InvalidBoardSizeException, InvalidMoveException
 from facades import MarkMove, Board, Cell, CollapseMove
+from metrics import current_timer
+from settings import MIN_WIN_LENGTH
 
 
 class BaseEngine:
 
     _ENGINE = None
+    # whether play_move always answers the same to the same board, move and seed
+    DETERMINISTIC = True
 
     def __init__(self, board_size: int):
         self.board_size = board_size
 
-    def start_game(self) -> Board:
+    def start_game(
+            self,
+            seed: Optional[int] = None,
+            win_length: Optional[int] = None,
+            moves: Optional[List[Union[MarkMove, CollapseMove]]] = None
+    ) -> Board:
+        """
+        :param seed: Optional[int], seed of the AI randomness, drawn from the OS when None
+        :param win_length: Optional[int], marks in a row needed to win, the board size when None
+        :param moves: Optional[List[Union[MarkMove, CollapseMove]]], the AI first move is appended to it if played
+
+        :return: Board
 
+        :raise InvalidBoardSizeException
+        """
         if self._ENGINE is None:
             raise ValueError('self._ENGINE is not defined')
 
-        board = Board(
+        if win_length is not None and not MIN_WIN_LENGTH <= win_length <= self.board_size:
+            raise InvalidBoardSizeException(f'win_length must be between {MIN_WIN_LENGTH} and {self.board_size}')
+
+        rng = Random(seed)
+
+        board = CopyOnWriteBoard(Board(
             [Cell([]) for i in range(0, self.board_size * self.board_size)],
             self.board_size,
             None,
-            self._ENGINE
-        )
+            self._ENGINE,
+            win_length
+        ))
 
         # we randomly decide to make the AI play the first move
-        if choice([True, False]):
-            ai_move = self._get_ai_move(board)
+        if rng.choice([True, False]):
+            ai_move = self._get_ai_move(board.board, rng)
             self._update_board(ai_move, board)
+            if moves is not None:
+                moves.append(ai_move)
+
+        return board.board
+
+    def play_move(
+            self,
+            move: Union[MarkMove, CollapseMove],
+            previous_board: Board,
+            trusted_board: bool = False,
+            seed: Optional[int] = None,
+            moves: Optional[List[Union[MarkMove, CollapseMove]]] = None,
+            changed_cells: Optional[List[int]] = None
+    ) -> Board:
+        """
+        Play move then the AI answer on previous_board
+
+        :param move: Union[MarkMove, CollapseMove]
+        :param previous_board: Board
+        :param trusted_board: bool, whether previous_board is known to be valid
+        :param seed: Optional[int], seed of the AI randomness, drawn from the OS when None
+        :param moves: Optional[List[Union[MarkMove, CollapseMove]]], the moves applied (move, then the AI answer
+            unless move ended the game) are appended to it
+        :param changed_cells: Optional[List[int]], the indexes of the cells written are appended to it, in increasing
+            order, game over included
+
+        :return: Board
+
+        :raise InvalidMoveException, InvalidBoardException, GameIsOverException
+        """
+        timer = current_timer()
 
-        return board
+        # a board this server issued (its signature was verified) does not need to be checked again
+        if not trusted_board:
+            self._check_board_validity(previous_board)
+            timer.lap('check_board')
 
-    def play_move(self, move: Union[MarkMove, CollapseMove], previous_board: Board) -> Board:
+        self._check_not_over(previous_board)
         self._check_move_validity(move, previous_board)
+        timer.lap('check_move')
 
-        new_board = deepcopy(previous_board)
+        # previous_board is never mutated: new_board shares its cells and only clones the ones a move writes to
+        new_board = CopyOnWriteBoard(previous_board)
+        rng = Random(seed)
+        timer.lap('copy')
 
         # We first play player's move (self._update_board), check if there is a winner then
         # play AI move (built by self._get_ai_move) then check there's a winner again.
         # If not returned updated Board
-        for m in [lambda: move, lambda: self._get_ai_move(new_board)]:
-            self._update_board(m(), new_board)
-            winner = self._get_winner(new_board)
-            if winner is not None:
-                raise GameIsOverException(
-                    new_board,
-                    winner
-                )
+        try:
+            for m in [lambda: move, lambda: self._get_ai_move(new_board.board, rng)]:
+                next_move = m()
+                if next_move is not move:
+                    timer.lap('ai_move')
+                    # the player filled the board: the game is a draw, left for the client to notice (no legal move)
+                    if next_move is None:
+                        break
+                self._update_board(next_move, new_board)
+                if moves is not None:
+                    moves.append(next_move)
+                timer.lap('update_board')
+                winner = self._get_winner(new_board.board)
+                timer.lap('get_winner')
+                if winner is not None:
+                    raise GameIsOverException(
+                        new_board.board,
+                        winner
+                    )
+        finally:
+            # every write went through new_board, which cloned the cells it wrote
+            if changed_cells is not None:
+                changed_cells.extend(new_board.changed_cells())
+
+        return new_board.board
+
+    def _check_board_validity(self, board: Board):
+        """
+        Check whether a board sent by a client is a consistent game state, raising InvalidBoardException if not
+        No check by default
+
+        :param board: Board
+
+        :raise InvalidBoardException
+        """
+        return
 
-        return new_board
+    def _check_not_over(self, board: Board):
+        """
+        Check no player won on board, raising InvalidMoveException if one did: a finished game takes no more move,
+        though its board is issued with a token like any other
+
+        :param board: Board
+
+        :raise InvalidMoveException
+        """
+        if self._get_winner(board) is not None:
+            raise InvalidMoveException('The game is already over.')
 
     def _check_move_validity(self, move: Union[MarkMove, CollapseMove], previous_board: Board):
         """
@@ -62,13 +162,15 @@ class BaseEngine:
         """
         raise NotImplementedError()
 
-    def _update_board(self, move: Union[MarkMove, CollapseMove], board: Board):
+    def _update_board(self, move: Union[MarkMove, CollapseMove], board: CopyOnWriteBoard):
         """
         Update board object by applying move
         if relevant, set board.cells_indexes_to_be_collapsed to the indexes of the two cells that needs to be collapsed
+        cells MUST be modified through board.add_quantic_mark / remove_quantic_mark / collapse_cell,
+        other cells being shared with the previous board
 
         :param move: MarkMove
-        :param previous_board: Board
+        :param board: CopyOnWriteBoard
         """
         raise NotImplementedError()
 
@@ -82,24 +184,67 @@ class BaseEngine:
         """
         raise NotImplementedError()
 
-    def _get_ai_move(self, board: Board) -> Union[MarkMove, CollapseMove]:
+    def legal_cells_mask(self, board: Board) -> int:
+        """
+        Bit mask form of legal_moves: bit i is set when cell i is one of the cells of the pending collapse,
+        or when no collapse is pending, when cell i is not collapsed (any two of those cells make a legal MarkMove)
+
+        :param board: Board
+
+        :return: int
+        """
+        if board.cells_indexes_to_be_collapsed is not None:
+            first_cell, second_cell = board.cells_indexes_to_be_collapsed
+            return 1 << first_cell | 1 << second_cell
+
+        mask = 0
+        for index, cell in enumerate(board.cells):
+            if cell.collapsed_mark is None:
+                mask |= 1 << index
+
+        return mask
+
+    def legal_moves(self, board: Board) -> Iterator[Union[MarkMove, CollapseMove]]:
+        """
+        Every legal move on board, generated lazily: a CollapseMove per cell of the pending collapse,
+        or when none is pending MarkMove(first_cell, second_cell) for each pair of uncollapsed cells,
+        first_cell < second_cell (the same move with both cells swapped being legal as well)
+
+        :param board: Board
 
+        :return: Iterator[Union[MarkMove, CollapseMove]]
+        """
+        cells = mask_cells(self.legal_cells_mask(board))
+
+        if board.cells_indexes_to_be_collapsed is not None:
+            for cell in cells:
+                yield CollapseMove(cell)
+            return
+
+        for i, first_cell in enumerate(cells):
+            for second_cell in cells[i + 1:]:
+                yield MarkMove(first_cell, second_cell)
+
+    def _get_ai_move(self, board: Board, rng: Random) -> Optional[Union[MarkMove, CollapseMove]]:
+        """
+        :param board: Board
+        :param rng: Random, the only source of randomness of the AI, so that a seed replays its moves
+
+        :return: Optional[Union[MarkMove, CollapseMove]], None when there is no legal move (the game is a draw)
+        """
         if board.cells_indexes_to_be_collapsed:
-            i = randint(0, 1)
+            i = rng.randint(0, 1)
             return CollapseMove(
                 board.cells_indexes_to_be_collapsed[i]
             )
 
-        available_cells: List[Tuple[Cell, int]] = list(filter(
-            lambda tu: tu[0].collapsed_mark is None,
-            [(c, i) for i, c in enumerate(board.cells)],
-        ))
+        available_cells = mask_cells(self.legal_cells_mask(board))
+        if len(available_cells) < 2:
+            return None
 
-        selected_cells = sample(available_cells, 2)
+        selected_cells = rng.sample(available_cells, 2)
 
         return MarkMove(
-            selected_cells[0][1],
-            selected_cells[1][1],
+            selected_cells[0],
+            selected_cells[1],
         )
-
-
@@ -0,0 +1,153 @@
+"""
+    Vectorized evaluation of many boards at once: boards are packed into NumPy arrays and winners / legal moves
+    of all of them are computed with a few array operations, giving the same results as CaseEngine
+"""
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from engines.bitboard import get_win_masks
+from facades import Board
+from settings import PLAYER_1, PLAYER_2
+
+# owners array values, 0 being an uncollapsed cell
+PLAYERS = (None, PLAYER_1, PLAYER_2)
+_PLAYER_CODES = {PLAYER_1: 1, PLAYER_2: 2}
+
+
+@lru_cache(maxsize=None)
+def get_line_indexes(board_size: int, win_length: Optional[int] = None) -> np.ndarray:
+    """
+    Cell indexes of the winning lines, in the order of get_win_masks
+
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, board_size when None
+
+    :return: np.ndarray, lines count x win_length
+    """
+    lines = [
+        [i for i in range(board_size * board_size) if mask >> i & 1]
+        for mask in get_win_masks(board_size, win_length)
+    ]
+    indexes = np.array(lines, dtype=np.intp)
+    indexes.setflags(write=False)
+
+    return indexes
+
+
+class BoardBatch:
+    """
+        Boards of the same size and win length packed as arrays, one row per board:
+        owners (player code of the collapsed mark of each cell, see PLAYERS), quantic (number of quantum marks
+        of each cell) and pending (cells of the pending collapse, -1 when none)
+    """
+
+    __slots__ = ('board_size', 'win_length', 'owners', 'quantic', 'pending')
+
+    def __init__(
+            self,
+            board_size: int,
+            owners: np.ndarray,
+            quantic: np.ndarray,
+            pending: np.ndarray,
+            win_length: Optional[int] = None
+    ):
+        self.board_size = board_size
+        self.win_length = win_length or board_size
+        self.owners = owners
+        self.quantic = quantic
+        self.pending = pending
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    @classmethod
+    def from_boards(cls, boards: Sequence[Board]) -> 'BoardBatch':
+        """
+        :param boards: Sequence[Board], boards of the same size and win length
+
+        :return: BoardBatch
+
+        :raise ValueError if boards differ in size or win length, or a mark belongs to neither PLAYER_1 nor PLAYER_2
+        """
+        if not boards:
+            raise ValueError('cannot pack an empty sequence of boards')
+
+        board_size = boards[0].board_size
+        win_length = boards[0].win_length or board_size
+        cells_count = board_size * board_size
+        owners = np.zeros((len(boards), cells_count), dtype=np.int8)
+        quantic = np.zeros((len(boards), cells_count), dtype=np.uint8)
+        pending = np.full((len(boards), 2), -1, dtype=np.int16)
+
+        for row, board in enumerate(boards):
+            if board.board_size != board_size or len(board.cells) != cells_count:
+                raise ValueError(f'board {row} is not a {board_size}x{board_size} board')
+            if (board.win_length or board_size) != win_length:
+                raise ValueError(f'board {row} is not won with {win_length} marks in a row')
+
+            for index, cell in enumerate(board.cells):
+                if cell.collapsed_mark is not None:
+                    try:
+                        owners[row, index] = _PLAYER_CODES[cell.collapsed_mark.player_id]
+                    except KeyError:
+                        raise ValueError(f'unknown player {cell.collapsed_mark.player_id} in board {row}')
+                quantic[row, index] = len(cell.quantic_marks)
+
+            if board.cells_indexes_to_be_collapsed is not None:
+                pending[row] = board.cells_indexes_to_be_collapsed
+
+        return cls(board_size, owners, quantic, pending, win_length)
+
+    def winners(self) -> np.ndarray:
+        """
+        Player code (see PLAYERS) owning the first full line of each board, in the order CaseEngine checks lines
+
+        :return: np.ndarray of int8, 0 for boards without a winner
+        """
+        lines = self.owners[:, get_line_indexes(self.board_size, self.win_length)]
+        first_player = (lines == 1).all(axis=2)
+        second_player = (lines == 2).all(axis=2)
+
+        full = first_player | second_player
+        first_full = full.argmax(axis=1)
+        rows = np.arange(len(self))
+
+        return np.where(
+            full[rows, first_full],
+            np.where(first_player[rows, first_full], 1, 2),
+            0
+        ).astype(np.int8)
+
+    def winner_ids(self) -> List[Optional[str]]:
+        """
+        :return: List[Optional[str]], what CaseEngine._get_winner returns for each board
+        """
+        return [PLAYERS[code] for code in self.winners().tolist()]
+
+    def legal_mark_moves(self) -> np.ndarray:
+        """
+        :return: np.ndarray of bool, boards x cells x cells, [b, i, j] being whether MarkMove(i, j) is legal on board b
+        """
+        cells_count = self.owners.shape[1]
+        free = self.owners == 0
+        no_pending = self.pending[:, 0] < 0
+
+        legal = free[:, :, None] & free[:, None, :]
+        legal &= ~np.eye(cells_count, dtype=bool)
+        legal &= no_pending[:, None, None]
+
+        return legal
+
+    def legal_collapse_moves(self) -> np.ndarray:
+        """
+        :return: np.ndarray of bool, boards x cells, [b, i] being whether CollapseMove(i) is legal on board b
+        """
+        legal = np.zeros(self.owners.shape, dtype=bool)
+
+        rows = np.flatnonzero(self.pending[:, 0] >= 0)
+        legal[rows, self.pending[rows, 0]] = True
+        legal[rows, self.pending[rows, 1]] = True
+
+        return legal
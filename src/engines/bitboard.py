@@ -0,0 +1,144 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from facades import Board
+
+Player = TypeVar('Player')
+
+
+@lru_cache(maxsize=None)
+def get_line_starts(board_size: int, win_length: Optional[int] = None) -> Tuple[Tuple[int, int], ...]:
+    """
+    Directions of the winning lines as (shift between two consecutive cells, mask of the cells a line can start from),
+    ordered rows, columns, diagonals then anti-diagonals
+
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, board_size when None
+
+    :return: Tuple[Tuple[int, int], ...]
+    """
+    win_length = win_length or board_size
+    last_start = board_size - win_length
+
+    def starts(rows: range, columns: range) -> int:
+        return sum(1 << (r * board_size + c) for r in rows for c in columns)
+
+    every = range(board_size)
+    return (
+        (1, starts(every, range(last_start + 1))),
+        (board_size, starts(range(last_start + 1), every)),
+        (board_size + 1, starts(range(last_start + 1), range(last_start + 1))),
+        (board_size - 1, starts(range(last_start + 1), range(win_length - 1, board_size))),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_win_masks(board_size: int, win_length: Optional[int] = None) -> Tuple[int, ...]:
+    """
+    Precompute the winning lines of a board as bit masks, bit i standing for board.cells[i]
+
+    Lines are ordered by direction (rows, columns, diagonals then anti-diagonals) then by first cell, which for
+    lines as long as the board is the order CaseEngine has always used to pick a winner.
+
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, board_size when None
+
+    :return: Tuple[int, ...]
+    """
+    win_length = win_length or board_size
+
+    masks = []
+    for shift, starts in get_line_starts(board_size, win_length):
+        line = sum(1 << (i * shift) for i in range(win_length))
+        masks.extend(line << start for start in range(board_size * board_size) if starts >> start & 1)
+
+    return tuple(masks)
+
+
+def first_line_owner(
+        players: Iterable[Tuple[Player, int]],
+        board_size: int,
+        win_length: Optional[int] = None
+) -> Optional[Player]:
+    """
+    Return the player owning the first full line (in get_win_masks order), if any
+
+    Rather than testing every line, the cells starting a full line are found with win_length shifted ANDs
+    per direction, so the cost does not grow with the number of lines of large boards.
+
+    :param players: Iterable[Tuple[Player, int]], each player with the mask of its cells
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, board_size when None
+
+    :return: Optional[Player]
+    """
+    win_length = win_length or board_size
+    players = list(players)
+
+    for shift, starts in get_line_starts(board_size, win_length):
+        first_start, owner = 0, None
+
+        for player, mask in players:
+            full = mask & starts
+            for i in range(1, win_length):
+                if not full:
+                    break
+                full &= mask >> (i * shift)
+
+            # lowest bit set: the first line of this direction owned by player
+            first = full & -full
+            if first and (owner is None or first < first_start):
+                first_start, owner = first, player
+
+        if owner is not None:
+            return owner
+
+    return None
+
+
+def mask_cells(mask: int) -> List[int]:
+    """
+    :param mask: int
+
+    :return: List[int], indexes of the bits set in mask, in increasing order
+    """
+    cells = []
+    while mask:
+        lowest = mask & -mask
+        cells.append(lowest.bit_length() - 1)
+        mask ^= lowest
+
+    return cells
+
+
+class BitBoard:
+    """
+        Collapsed cells of a Board packed as one integer per player,
+        bit i being set when board.cells[i] collapsed to one of the player's marks
+    """
+
+    __slots__ = ('board_size', 'win_length', 'players')
+
+    def __init__(self, board_size: int, players: Optional[Dict[str, int]] = None, win_length: Optional[int] = None):
+        self.board_size = board_size
+        self.win_length = win_length or board_size
+        self.players: Dict[str, int] = players if players is not None else {}
+
+    @classmethod
+    def from_board(cls, board: Board) -> 'BitBoard':
+        players: Dict[str, int] = {}
+
+        for index, cell in enumerate(board.cells):
+            if cell.collapsed_mark is not None:
+                player_id = cell.collapsed_mark.player_id
+                players[player_id] = players.get(player_id, 0) | (1 << index)
+
+        return cls(board.board_size, players, board.win_length)
+
+    def winner(self) -> Optional[str]:
+        """
+        Return the id of the player owning a full winning line, if any
+
+        :return: Optional[str]
+        """
+        return first_line_owner(self.players.items(), self.board_size, self.win_length)
@@ -0,0 +1,122 @@
+from typing import Dict, List, Optional
+
+from engines.bitboard import BitBoard
+from engines.entanglement import EntanglementGraph, MarkKey, mark_key
+from exceptions import InvalidBoardException
+from facades import Board, Mark
+from settings import PLAYER_1, PLAYER_2, MIN_WIN_LENGTH
+
+
+def validate_board(board: Board):
+    """
+    Check a board is a state CaseEngine rules can reach, raising InvalidBoardException if not:
+        - board_size * board_size cells, win_length (if any) between MIN_WIN_LENGTH and board_size
+        - collapsed cells hold no quantum mark
+        - every quantum mark is in two distinct cells
+        - rounds 1 to the last one are each played once, odd rounds by PLAYER_1 and even ones by PLAYER_2
+        - quantum marks do not form a cycle, but the one closed by the mark entangling cells_indexes_to_be_collapsed
+        - collapses can have collapsed the cells: none if no cell is collapsed, at most one per two collapsed cells
+        - no player won: a finished game is not played on
+
+    A collapse resolves every mark it forces (CaseEngine._propagate_collapse), so no mark is ever left alone
+    in a cell nor disappears from the board.
+
+    Cells are read once, marks being indexed by (player_id, round_index) instead of being searched for.
+
+    :param board: Board
+
+    :raise InvalidBoardException
+    """
+    size = board.board_size
+    if size < 1 or len(board.cells) != size * size:
+        raise InvalidBoardException(f'A board of size {size} must have {size * size} cells.')
+
+    if board.win_length is not None and not MIN_WIN_LENGTH <= board.win_length <= size:
+        raise InvalidBoardException(f'win_length must be between {MIN_WIN_LENGTH} and {size}.')
+
+    mark_cells: Dict[MarkKey, List[int]] = {}
+    marks: Dict[MarkKey, Mark] = {}
+    rounds: Dict[int, str] = {}
+
+    for index, cell in enumerate(board.cells):
+        if cell.collapsed_mark is not None:
+            if cell.quantic_marks:
+                raise InvalidBoardException(f'Collapsed cell {index} still holds quantum marks.')
+
+            _check_round(rounds, cell.collapsed_mark)
+            continue
+
+        for mark in cell.quantic_marks:
+            key = mark_key(mark)
+            cells = mark_cells.get(key)
+            if cells is None:
+                mark_cells[key] = [index]
+                marks[key] = mark
+                _check_round(rounds, mark)
+            elif cells[-1] == index:
+                raise InvalidBoardException(f'Mark {mark.player_id}{mark.round_index} is twice in cell {index}.')
+            else:
+                cells.append(index)
+
+    for key, cells in mark_cells.items():
+        if len(cells) != 2:
+            raise InvalidBoardException(f'Mark {key[0]}{key[1]} must be in two cells, found in {cells}.')
+
+    if rounds and len(rounds) != max(rounds):
+        missing = min(set(range(1, max(rounds) + 1)) - set(rounds))
+        raise InvalidBoardException(f'Round {missing} is missing.')
+
+    collapsed_count = sum(1 for cell in board.cells if cell.collapsed_mark is not None)
+    if board.collapses < 0 or 2 * board.collapses > collapsed_count or (collapsed_count and not board.collapses):
+        raise InvalidBoardException(f'{board.collapses} collapses cannot have collapsed {collapsed_count} cells.')
+
+    initiating_key = _get_initiating_mark_key(board, mark_cells)
+    if initiating_key is not None and initiating_key[1] != max(rounds):
+        raise InvalidBoardException('A mark was placed while a collapse was pending.')
+
+    if BitBoard.from_board(board).winner() is not None:
+        raise InvalidBoardException('The game is already over.')
+
+    graph = EntanglementGraph(len(board.cells))
+    for key, cells in mark_cells.items():
+        if len(cells) == 2 and key != initiating_key and graph.add_mark(marks[key], cells[0], cells[1]):
+            raise InvalidBoardException('Quantum marks form a cycle which was not collapsed.')
+
+    if initiating_key is not None and not graph.connected(*mark_cells[initiating_key]):
+        raise InvalidBoardException('cells_indexes_to_be_collapsed do not close a cycle.')
+
+
+def _check_round(rounds: Dict[int, str], mark: Mark):
+    if mark.round_index in rounds:
+        raise InvalidBoardException(f'Round {mark.round_index} is played more than once.')
+
+    expected_player_id = PLAYER_1 if mark.round_index % 2 != 0 else PLAYER_2
+    if mark.player_id != expected_player_id:
+        raise InvalidBoardException(f'Round {mark.round_index} must be played by {expected_player_id}.')
+
+    rounds[mark.round_index] = mark.player_id
+
+
+def _get_initiating_mark_key(board: Board, mark_cells: Dict[MarkKey, List[int]]) -> Optional[MarkKey]:
+    """
+    Find the mark whose placement closed the cycle waiting to be collapsed: the latest one entangling both cells
+
+    :return: Optional[MarkKey], None if no collapse is pending
+    """
+    if board.cells_indexes_to_be_collapsed is None:
+        return None
+
+    first_cell, second_cell = board.cells_indexes_to_be_collapsed
+    if first_cell == second_cell or not all(0 <= c < len(board.cells) for c in (first_cell, second_cell)):
+        raise InvalidBoardException('Invalid cells_indexes_to_be_collapsed.')
+
+    initiating_key = None
+    for mark in board.cells[first_cell].quantic_marks:
+        key = mark_key(mark)
+        if second_cell in mark_cells[key] and (initiating_key is None or key[1] > initiating_key[1]):
+            initiating_key = key
+
+    if initiating_key is None or len(mark_cells[initiating_key]) != 2:
+        raise InvalidBoardException('cells_indexes_to_be_collapsed are not entangled.')
+
+    return initiating_key
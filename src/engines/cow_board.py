@@ -0,0 +1,162 @@
+from typing import List, Optional, Set, Tuple
+
+from engines.game_state import GameState
+from engines.zobrist import Permutation, board_hashes, get_key_symmetries, mark_key
+from facades import Board, Cell, Mark
+
+
+class CopyOnWriteBoard:
+    """
+        Board being built from a previous one without copying it whole:
+        cells are shared with the previous board until cell_for_write clones them.
+        Marks are never mutated once placed, so cloned cells keep sharing them.
+
+        Reads go through cells / board_size / cells_indexes_to_be_collapsed like on a Board,
+        every write to a cell MUST go through add_quantic_mark / remove_quantic_mark / collapse_cell,
+        which also keep the GameState and the Zobrist hashes of the board up to date once they have been built.
+    """
+
+    __slots__ = ('board', '_cloned_cells', '_state', '_hashes')
+
+    def __init__(self, previous_board: Board):
+        self.board = Board(
+            list(previous_board.cells),
+            previous_board.board_size,
+            previous_board.cells_indexes_to_be_collapsed,
+            previous_board.engine,
+            previous_board.win_length,
+            previous_board.collapses
+        )
+        self._cloned_cells: Set[int] = set()
+        self._state: Optional[GameState] = None
+        # Zobrist hash of the board under each of _symmetries(), identity first
+        self._hashes: Optional[List[int]] = None
+
+    @property
+    def cells(self) -> List[Cell]:
+        return self.board.cells
+
+    @property
+    def board_size(self) -> int:
+        return self.board.board_size
+
+    @property
+    def engine(self) -> str:
+        return self.board.engine
+
+    @property
+    def win_length(self) -> Optional[int]:
+        return self.board.win_length
+
+    @property
+    def cells_indexes_to_be_collapsed(self) -> Optional[Tuple[int, int]]:
+        return self.board.cells_indexes_to_be_collapsed
+
+    @cells_indexes_to_be_collapsed.setter
+    def cells_indexes_to_be_collapsed(self, value: Optional[Tuple[int, int]]):
+        self.board.cells_indexes_to_be_collapsed = value
+
+    @property
+    def collapses(self) -> int:
+        return self.board.collapses
+
+    @collapses.setter
+    def collapses(self, value: int):
+        self.board.collapses = value
+
+    def cell_for_write(self, index: int) -> Cell:
+        """
+        Return a cell owned by this board, cloning the shared one on first write
+
+        :param index: int
+
+        :return: Cell
+        """
+        if index not in self._cloned_cells:
+            cell = self.board.cells[index]
+            self.board.cells[index] = Cell(list(cell.quantic_marks), cell.collapsed_mark)
+            self._cloned_cells.add(index)
+
+        return self.board.cells[index]
+
+    def changed_cells(self) -> List[int]:
+        return sorted(self._cloned_cells)
+
+    @property
+    def state(self) -> GameState:
+        # built on first use only, then maintained by each write
+        if self._state is None:
+            self._state = GameState.from_board(self.board)
+
+        return self._state
+
+    @property
+    def zobrist_hash(self) -> int:
+        return self._get_hashes()[0]
+
+    def canonical_hash(self) -> Tuple[int, Permutation]:
+        """
+        Same as zobrist.canonical_hash(self.board), maintained by each write instead of being recomputed
+
+        :return: Tuple[int, Permutation], the canonical hash and the permutation taking the board to its canonical
+            orientation
+        """
+        return min(zip(self._get_hashes(), self._symmetries()))
+
+    def add_quantic_mark(self, index: int, mark: Mark):
+        self.cell_for_write(index).quantic_marks.append(mark)
+        self._toggle(index, mark, False)
+        if self._state is not None:
+            self._state.add_quantic_mark(index, mark)
+
+    def remove_quantic_mark(self, index: int, mark: Mark):
+        if self._state is not None:
+            if mark.round_index not in self._state.cell_marks[index]:
+                return
+            self._state.remove_quantic_mark(index, mark)
+        elif mark not in self.board.cells[index].quantic_marks:
+            return
+
+        cell = self.cell_for_write(index)
+        # a mark is identified by its round, no need to compare its player
+        cell.quantic_marks = [m for m in cell.quantic_marks if m.round_index != mark.round_index]
+        self._toggle(index, mark, False)
+
+    def collapse_cell(self, index: int, mark: Mark):
+        """
+        Make mark the classical mark of cell index, dropping its quantum marks
+
+        :param index: int
+        :param mark: Mark
+        """
+        cell = self.cell_for_write(index)
+        if self._hashes is not None:
+            for quantic_mark in cell.quantic_marks:
+                self._toggle(index, quantic_mark, False)
+            if cell.collapsed_mark is not None:
+                self._toggle(index, cell.collapsed_mark, True)
+
+        cell.quantic_marks.clear()
+        cell.collapsed_mark = mark
+        self._toggle(index, mark, True)
+        if self._state is not None:
+            self._state.collapse_cell(index, mark)
+
+    def _symmetries(self) -> Tuple[Permutation, ...]:
+        return get_key_symmetries(self.board.board_size, self.board.win_length)
+
+    def _get_hashes(self) -> List[int]:
+        # computed on first use only, then maintained by each write
+        if self._hashes is None:
+            self._hashes = board_hashes(self.board, self._symmetries())
+
+        return self._hashes
+
+    def _toggle(self, index: int, mark: Mark, collapsed: bool):
+        if self._hashes is None:
+            return
+
+        size = self.board.board_size
+        for i, permutation in enumerate(self._symmetries()):
+            self._hashes[i] ^= mark_key(size, permutation[index], mark, collapsed)
+
@@ -1,6 +1,7 @@
 from typing import Union, List, Tuple, Optional
 
 from engines.base_engine import BaseEngine
+from engines.cow_board import CopyOnWriteBoard
 from facades import MarkMove, Board, CollapseMove, Mark, Engine, Cell
 from settings import PLAYER_1, PLAYER_2
 
@@ -13,21 +14,21 @@ class DummyEngine(BaseEngine):
         It's only here to provide an example of BaseEngine abstract methods implementation and
         allow a "kind of" play using play.py
     """
-    _ENGINE = Engine.DUMMY
+    _ENGINE = Engine.DUMMY.value
 
     def _check_move_validity(self, move: Union[MarkMove, CollapseMove], previous_board: Board):
         # Always valid for this engine
         return
 
-    def _update_board(self, move: Union[MarkMove, CollapseMove], board: Board):
+    def _update_board(self, move: Union[MarkMove, CollapseMove], board: CopyOnWriteBoard):
         # CollapseMove is not supported
 
         next_index = max([a.round_index for c in board.cells for a in c.quantic_marks] + [0]) + 1
         player_id = PLAYER_1 if next_index % 2 == 0 else PLAYER_2
 
         if isinstance(move, MarkMove):
-            board.cells[move.first_cell].quantic_marks.append(Mark(player_id, next_index))
-            board.cells[move.second_cell].quantic_marks.append(Mark(player_id, next_index))
+            board.add_quantic_mark(move.first_cell, Mark(player_id, next_index))
+            board.add_quantic_mark(move.second_cell, Mark(player_id, next_index))
 
     def _get_winner(self, board: Board) -> Optional[str]:
         # Return PLAYER_1 as winner when STOP_AFTER_N_MARKS cells has been marked at least once
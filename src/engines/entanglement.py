@@ -0,0 +1,56 @@
+from typing import Tuple
+
+from facades import Mark
+
+MarkKey = Tuple[str, int]
+
+
+def mark_key(mark: Mark) -> MarkKey:
+    # Mark dataclasses are not hashable, a mark is identified by its player and round
+    return mark.player_id, mark.round_index
+
+
+class EntanglementGraph:
+    """
+        Cells are the nodes of the graph and every quantum mark present in two cells is an edge between them.
+        Connectivity is tracked with a union-find so that checking whether a new mark closes
+        a cycle is near O(1).
+    """
+
+    def __init__(self, cells_count: int):
+        self._parents = list(range(cells_count))
+        self._ranks = [0] * cells_count
+
+    def find(self, cell_index: int) -> int:
+        parents = self._parents
+        while parents[cell_index] != cell_index:
+            # path halving
+            parents[cell_index] = parents[parents[cell_index]]
+            cell_index = parents[cell_index]
+
+        return cell_index
+
+    def connected(self, first_cell: int, second_cell: int) -> bool:
+        return self.find(first_cell) == self.find(second_cell)
+
+    def add_mark(self, mark: Mark, first_cell: int, second_cell: int) -> bool:
+        """
+        Add the edge of a mark entangling first_cell and second_cell
+
+        :param mark: Mark
+        :param first_cell: int
+        :param second_cell: int
+
+        :return: bool, True if both cells were already connected, i.e. the mark closes a cycle
+        """
+        first_root, second_root = self.find(first_cell), self.find(second_cell)
+        if first_root == second_root:
+            return True
+
+        if self._ranks[first_root] < self._ranks[second_root]:
+            first_root, second_root = second_root, first_root
+        self._parents[second_root] = first_root
+        if self._ranks[first_root] == self._ranks[second_root]:
+            self._ranks[first_root] += 1
+
+        return False
@@ -0,0 +1,94 @@
+from typing import Dict, List, Optional, Tuple
+
+from engines.entanglement import EntanglementGraph
+from facades import Board, Mark
+
+# one mark is played per round: a mark is identified by its round index
+MarkId = int
+
+
+class GameState:
+    """
+        Compact view of the quantum marks of a board, built once from its cells then kept up to date by
+        CopyOnWriteBoard writes, so that engines do not rescan the cells:
+        quantum mark ids of each cell, cells of each quantum mark (two, or one for a mark left behind by
+        a collapse), the last round played and the entanglement graph of the marks
+    """
+
+    __slots__ = ('round_index', 'cell_marks', 'mark_cells', 'marks', '_graph')
+
+    def __init__(self, cells_count: int):
+        self.round_index = 0
+        self.cell_marks: List[List[MarkId]] = [[] for _ in range(cells_count)]
+        self.mark_cells: Dict[MarkId, Tuple[int, ...]] = {}
+        # the Mark instance of each id, shared by both of its cells
+        self.marks: Dict[MarkId, Mark] = {}
+        self._graph: Optional[EntanglementGraph] = None
+
+    @classmethod
+    def from_board(cls, board: Board) -> 'GameState':
+        state = cls(len(board.cells))
+
+        for index, cell in enumerate(board.cells):
+            for mark in cell.quantic_marks:
+                state.add_quantic_mark(index, mark)
+            if cell.collapsed_mark is not None and cell.collapsed_mark.round_index > state.round_index:
+                state.round_index = cell.collapsed_mark.round_index
+
+        return state
+
+    def add_quantic_mark(self, index: int, mark: Mark):
+        mark_id = mark.round_index
+        self.cell_marks[index].append(mark_id)
+        self.mark_cells[mark_id] = self.mark_cells.get(mark_id, ()) + (index,)
+        self.marks.setdefault(mark_id, mark)
+        if mark_id > self.round_index:
+            self.round_index = mark_id
+
+        cells = self.mark_cells[mark_id]
+        if self._graph is not None and len(cells) == 2:
+            self._graph.add_mark(mark, cells[0], cells[1])
+
+    @property
+    def graph(self) -> EntanglementGraph:
+        """
+        Entanglement graph of the quantum marks, built on first use then extended by add_quantic_mark.
+        Removed marks stay in it: a collapse makes classical every cell connected to the cycle it resolves,
+        so the edges left behind only join classical cells, which no mark entangles anymore
+        """
+        if self._graph is None:
+            self._graph = EntanglementGraph(len(self.cell_marks))
+            for mark_id, cells in self.mark_cells.items():
+                # a mark left in a single cell entangles nothing
+                if len(cells) == 2:
+                    self._graph.add_mark(self.marks[mark_id], cells[0], cells[1])
+
+        return self._graph
+
+    def remove_quantic_mark(self, index: int, mark: Mark):
+        mark_id = mark.round_index
+        if mark_id in self.cell_marks[index]:
+            self.cell_marks[index].remove(mark_id)
+            self._drop_cell(mark_id, index)
+
+    def collapse_cell(self, index: int, mark: Mark):
+        for mark_id in self.cell_marks[index]:
+            self._drop_cell(mark_id, index)
+        self.cell_marks[index] = []
+
+    def _drop_cell(self, mark_id: MarkId, index: int):
+        cells = tuple(cell for cell in self.mark_cells[mark_id] if cell != index)
+        if cells:
+            self.mark_cells[mark_id] = cells
+        else:
+            del self.mark_cells[mark_id]
+            del self.marks[mark_id]
+
+    def entangling_marks(self, first_cell: int, second_cell: int) -> List[MarkId]:
+        """
+        :param first_cell: int
+        :param second_cell: int
+
+        :return: List[MarkId], ids of the quantum marks present in both cells
+        """
+        return [mark_id for mark_id in self.cell_marks[first_cell] if second_cell in self.mark_cells[mark_id]]
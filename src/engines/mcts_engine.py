@@ -0,0 +1,358 @@
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from threading import Lock
+from typing import Dict, List, Optional, Tuple, Union
+
+from engines.bitboard import first_line_owner
+from engines.case_engine import CaseEngine
+from facades import MarkMove, Board, CollapseMove, Engine
+from settings import MCTS_TIME_BUDGET_MS, MCTS_WORKERS, MCTS_EXPLORATION, PROCESS_POOL_START_METHOD
+
+# check the clock every CLOCK_CHECK_INTERVAL iterations only
+CLOCK_CHECK_INTERVAL = 16
+
+
+def _round_player(round_index: int) -> int:
+    # marks are 1 (PLAYER_1, odd rounds) and 2 (PLAYER_2, even rounds) in search states, 0 being a draw
+    return 1 if round_index % 2 != 0 else 2
+
+
+class SearchState:
+    """
+        Minimal board used by the search: plain integers for marks (their round index) and moves,
+        one collapsed-cells bit mask per player and a union-find over cells for cycle detection.
+
+        A move is an int: first_cell * cells_count + second_cell (first_cell < second_cell) for a MarkMove,
+        -1 - selected_cell for a CollapseMove.
+
+        Players take turns at every move as they do through the API (BaseEngine.play_move), a collapse included:
+        player 1 is the one who placed the first mark and wins with the PLAYER_1 marks, but after an odd number of
+        collapses places PLAYER_2 marks (the symbol of a mark being given by its round).
+    """
+
+    __slots__ = (
+        'board_size', 'win_length', 'owners', 'masks', 'cell_marks', 'mark_cells', 'next_round', 'pending',
+        'pending_round', 'collapses', 'parents'
+    )
+
+    def __init__(self, board_size: int, win_length: Optional[int] = None):
+        cells_count = board_size * board_size
+
+        self.board_size = board_size
+        self.win_length = win_length or board_size
+        self.owners: List[int] = [0] * cells_count
+        self.masks: List[int] = [0, 0, 0]
+        self.cell_marks: List[List[int]] = [[] for _ in range(cells_count)]
+        self.mark_cells: Dict[int, Tuple[int, int]] = {}
+        self.next_round = 1
+        self.pending: Optional[Tuple[int, int]] = None
+        self.pending_round = 0
+        self.collapses = 0
+        self.parents: List[int] = list(range(cells_count))
+
+    @classmethod
+    def from_board(cls, board: Board) -> 'SearchState':
+        state = cls(board.board_size, board.win_length)
+
+        max_round_index = 0
+        first_cells: Dict[int, int] = {}
+        for index, cell in enumerate(board.cells):
+            if cell.collapsed_mark is not None:
+                player = _round_player(cell.collapsed_mark.round_index)
+                state.owners[index] = player
+                state.masks[player] |= 1 << index
+                max_round_index = max(max_round_index, cell.collapsed_mark.round_index)
+
+            for mark in cell.quantic_marks:
+                max_round_index = max(max_round_index, mark.round_index)
+                if mark.round_index in first_cells:
+                    state._add_mark(mark.round_index, first_cells.pop(mark.round_index), index)
+                else:
+                    first_cells[mark.round_index] = index
+
+        # marks left in a single cell are not entangled with anything anymore, they cannot collapse
+        state.next_round = max_round_index + 1
+        state.collapses = board.collapses
+
+        if board.cells_indexes_to_be_collapsed is not None:
+            state.pending = board.cells_indexes_to_be_collapsed
+            first_cell, second_cell = state.pending
+            state.pending_round = max(
+                r for r in state.cell_marks[first_cell] if second_cell in state.mark_cells[r]
+            )
+
+        return state
+
+    def copy(self) -> 'SearchState':
+        state = SearchState.__new__(SearchState)
+        state.board_size = self.board_size
+        state.win_length = self.win_length
+        state.owners = self.owners[:]
+        state.masks = self.masks[:]
+        state.cell_marks = [marks[:] for marks in self.cell_marks]
+        state.mark_cells = self.mark_cells.copy()
+        state.next_round = self.next_round
+        state.pending = self.pending
+        state.pending_round = self.pending_round
+        state.collapses = self.collapses
+        state.parents = self.parents[:]
+
+        return state
+
+    def to_move(self) -> int:
+        # every mark placed and every collapse resolved so far was a turn: the other player resolves the collapse
+        # a mark triggered, then the first one places the next mark
+        return 1 if (self.next_round - 1 + self.collapses) % 2 == 0 else 2
+
+    def free_cells(self) -> List[int]:
+        return [i for i, owner in enumerate(self.owners) if not owner]
+
+    def legal_moves(self) -> List[int]:
+        if self.pending is not None:
+            return [-1 - self.pending[0], -1 - self.pending[1]]
+
+        cells_count = len(self.owners)
+        free = self.free_cells()
+
+        return [a * cells_count + b for i, a in enumerate(free) for b in free[i + 1:]]
+
+    def closes_cycle(self, move: int) -> bool:
+        # a mark between two cells already linked by marks closes a cycle, triggering a collapse
+        if move < 0:
+            return False
+        first_cell, second_cell = divmod(move, len(self.owners))
+
+        return self._find(first_cell) == self._find(second_cell)
+
+    def play(self, move: int) -> Optional[int]:
+        """
+        Apply move
+
+        :param move: int
+
+        :return: Optional[int], the winner if the move ended the game
+        """
+        if move < 0:
+            self._collapse(-1 - move, self.pending_round)
+            self.pending = None
+            self.collapses += 1
+            self._rebuild_components()
+
+            return self.winner()
+
+        first_cell, second_cell = divmod(move, len(self.owners))
+        round_index = self.next_round
+        self.next_round += 1
+
+        if self._add_mark(round_index, first_cell, second_cell):
+            self.pending = (first_cell, second_cell)
+            self.pending_round = round_index
+
+        # placing a mark does not change collapsed cells, hence cannot make anyone win
+        return None
+
+    def winner(self) -> Optional[int]:
+        return first_line_owner(((1, self.masks[1]), (2, self.masks[2])), self.board_size, self.win_length)
+
+    def _find(self, cell_index: int) -> int:
+        parents = self.parents
+        while parents[cell_index] != cell_index:
+            parents[cell_index] = parents[parents[cell_index]]
+            cell_index = parents[cell_index]
+
+        return cell_index
+
+    def _add_mark(self, round_index: int, first_cell: int, second_cell: int) -> bool:
+        self.cell_marks[first_cell].append(round_index)
+        self.cell_marks[second_cell].append(round_index)
+        self.mark_cells[round_index] = (first_cell, second_cell)
+
+        first_root, second_root = self._find(first_cell), self._find(second_cell)
+        if first_root == second_root:
+            return True
+
+        self.parents[first_root] = second_root
+
+        return False
+
+    def _rebuild_components(self):
+        self.parents = list(range(len(self.owners)))
+        for first_cell, second_cell in self.mark_cells.values():
+            first_root, second_root = self._find(first_cell), self._find(second_cell)
+            if first_root != second_root:
+                self.parents[first_root] = second_root
+
+    def _collapse(self, cell_index: int, round_index: int):
+        # a cell turning classical forces every other mark it holds into that mark's other cell
+        work = [(cell_index, round_index)]
+        while work:
+            cell_index, round_index = work.pop()
+            if self.owners[cell_index]:
+                continue
+
+            player = _round_player(round_index)
+            self.owners[cell_index] = player
+            self.masks[player] |= 1 << cell_index
+
+            for other_round in self.cell_marks[cell_index]:
+                first_cell, second_cell = self.mark_cells.pop(other_round)
+                other_cell = second_cell if first_cell == cell_index else first_cell
+                self.cell_marks[other_cell].remove(other_round)
+                if other_round != round_index:
+                    work.append((other_cell, other_round))
+
+            self.cell_marks[cell_index] = []
+
+
+class _Node:
+    __slots__ = ('move', 'parent', 'player', 'children', 'untried', 'result', 'visits', 'score')
+
+    def __init__(self, move: Optional[int], parent: Optional['_Node'], player: int, untried: List[int],
+                 result: Optional[int]):
+        self.move = move
+        self.parent = parent
+        # player who played move
+        self.player = player
+        self.children: List['_Node'] = []
+        self.untried = untried
+        # winner (0 for a draw) if the game is over at this node
+        self.result = result
+        self.visits = 0
+        self.score = 0.0
+
+
+def _rollout(state: SearchState, rng: Random) -> int:
+    cells_count = len(state.owners)
+
+    while True:
+        if state.pending is not None:
+            winner = state.play(-1 - state.pending[rng.random() < 0.5])
+        else:
+            free = state.free_cells()
+            if len(free) < 2:
+                return 0
+            first_cell, second_cell = sorted(rng.sample(free, 2))
+            winner = state.play(first_cell * cells_count + second_cell)
+
+        if winner is not None:
+            return winner
+
+
+def search(root_state: SearchState, time_budget: float, seed: int, exploration: float) -> Dict[int, int]:
+    """
+    Run UCT Monte Carlo Tree Search from root_state for time_budget seconds
+
+    :return: Dict[int, int], visits of each move of root_state
+    """
+    rng = Random(seed)
+    deadline = time.perf_counter() + time_budget
+    root = _Node(None, None, 0, root_state.legal_moves(), None)
+
+    iterations = 0
+    while iterations == 0 or iterations % CLOCK_CHECK_INTERVAL != 0 or time.perf_counter() < deadline:
+        iterations += 1
+        node, state = root, root_state.copy()
+
+        # selection
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(
+                node.children,
+                key=lambda c: c.score / c.visits + exploration * math.sqrt(log_visits / c.visits)
+            )
+            state.play(node.move)
+
+        # expansion
+        if node.untried:
+            player = state.to_move()
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            winner = state.play(move)
+            if winner is None:
+                moves = state.legal_moves()
+                child = _Node(move, node, player, moves, None if moves else 0)
+            else:
+                child = _Node(move, node, player, [], winner)
+            node.children.append(child)
+            node = child
+
+        # simulation
+        result = node.result if node.result is not None else _rollout(state, rng)
+
+        # back propagation
+        while node is not None:
+            node.visits += 1
+            node.score += 1.0 if result == node.player else 0.5 if result == 0 else 0.0
+            node = node.parent
+
+    return {child.move: child.visits for child in root.children}
+
+
+def _search_worker(args: Tuple[SearchState, float, int, float]) -> Dict[int, int]:
+    return search(*args)
+
+
+_SEARCH_POOL: Optional[ProcessPoolExecutor] = None
+_SEARCH_POOL_LOCK = Lock()
+
+
+def _get_search_pool(workers: int) -> ProcessPoolExecutor:
+    global _SEARCH_POOL
+
+    with _SEARCH_POOL_LOCK:
+        if _SEARCH_POOL is None:
+            _SEARCH_POOL = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD)
+            )
+
+    return _SEARCH_POOL
+
+
+class MctsEngine(CaseEngine):
+    """
+        CaseEngine rules, the AI choosing its moves with Monte Carlo Tree Search.
+        The API being stateless, every move is searched from scratch: each of the `workers` processes
+        grows its own tree for `time_budget_ms` and root visits are summed (root parallelization).
+    """
+    _ENGINE = Engine.MCTS.value
+    # the number of iterations run within the time budget varies from one call to the other
+    DETERMINISTIC = False
+
+    def __init__(
+            self,
+            board_size: int,
+            time_budget_ms: int = MCTS_TIME_BUDGET_MS,
+            workers: int = MCTS_WORKERS,
+            exploration: float = MCTS_EXPLORATION
+    ):
+        super().__init__(board_size)
+        self.time_budget_ms = time_budget_ms
+        self.workers = workers
+        self.exploration = exploration
+
+    def _get_ai_move(self, board: Board, rng: Random) -> Optional[Union[MarkMove, CollapseMove]]:
+        state = SearchState.from_board(board)
+
+        moves = state.legal_moves()
+        if not moves:
+            return super()._get_ai_move(board, rng)
+
+        time_budget = self.time_budget_ms / 1000
+        if len(moves) == 1:
+            visits = {}
+        elif self.workers < 2:
+            visits = search(state, time_budget, rng.getrandbits(64), self.exploration)
+        else:
+            visits: Dict[int, int] = {}
+            jobs = [(state, time_budget, rng.getrandbits(64), self.exploration) for _ in range(self.workers)]
+            for worker_visits in _get_search_pool(self.workers).map(_search_worker, jobs):
+                for move, count in worker_visits.items():
+                    visits[move] = visits.get(move, 0) + count
+
+        best_move = max(visits, key=visits.get) if len(moves) > 1 else moves[0]
+        if best_move < 0:
+            return CollapseMove(-1 - best_move)
+
+        return MarkMove(*divmod(best_move, len(board.cells)))
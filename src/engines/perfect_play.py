@@ -0,0 +1,149 @@
+"""
+    Perfect-play table: position key -> best move and game value, as written by solver.py
+
+    Positions are keyed in their canonical orientation (see canonical_position_key): a position and its transposition
+    share one entry, whose move is given in the canonical orientation.
+
+    The table is an open addressing hash table stored in a flat file and read through mmap, so that every worker
+    process shares the same read-only pages and a lookup costs a couple of memory reads.
+
+    Layout (little endian):
+        header: magic (4s) version (H) board_size (H) slots_count (Q)
+        slots_count slots: key (Q, 0 for an empty slot) move (h) value (b) padding (5x)
+"""
+import mmap
+import struct
+from hashlib import blake2b
+from typing import Dict, Iterator, Optional, Tuple
+
+from engines.mcts_engine import SearchState
+from engines.zobrist import Permutation, get_key_symmetries
+
+MAGIC = b'QTTT'
+VERSION = 4
+HEADER = struct.Struct('<4sHHQ')
+SLOT = struct.Struct('<Qhb5x')
+
+# values are given for the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+
+def position_key(state: SearchState, permutation: Optional[Permutation] = None) -> int:
+    """
+    Key a position by what decides the rest of the game: cell owners, the player owning each quantum mark
+    (not its round), the player to move, the player whose mark is placed next (players taking turns at collapses
+    too, it is not always the one to move) and the pending collapse
+
+    :param state: SearchState
+    :param permutation: Optional[Permutation], symmetry to apply to the cells first
+
+    :return: int, a non zero 64 bits key
+    """
+    p = permutation or tuple(range(len(state.owners)))
+
+    owners = [0] * len(state.owners)
+    for index, owner in enumerate(state.owners):
+        owners[p[index]] = owner
+    marks = sorted(
+        (round_index % 2, *sorted((p[first_cell], p[second_cell])))
+        for round_index, (first_cell, second_cell) in state.mark_cells.items()
+    )
+    pending = None if state.pending is None else (
+        tuple(sorted((p[state.pending[0]], p[state.pending[1]]))), state.pending_round % 2
+    )
+
+    encoded = repr((state.board_size, owners, marks, state.to_move(), state.next_round % 2, pending)).encode()
+    key = int.from_bytes(blake2b(encoded, digest_size=8).digest(), 'little')
+
+    return key or 1
+
+
+def canonical_position_key(state: SearchState) -> Tuple[int, Permutation]:
+    """
+    :param state: SearchState
+
+    :return: Tuple[int, Permutation], the minimal key over the symmetries keeping the winner of the board
+        (see get_key_symmetries) and the symmetry giving it
+    """
+    return min((position_key(state, p), p) for p in get_key_symmetries(state.board_size, state.win_length))
+
+
+def map_search_move(move: int, permutation: Permutation) -> int:
+    """
+    Apply a permutation to the cells of a SearchState move
+
+    :param move: int
+    :param permutation: Permutation
+
+    :return: int
+    """
+    if move < 0:
+        return -1 - permutation[-1 - move]
+
+    first_cell, second_cell = sorted(permutation[c] for c in divmod(move, len(permutation)))
+
+    return first_cell * len(permutation) + second_cell
+
+
+def write_table(path: str, board_size: int, positions: Dict[int, Tuple[int, int]]):
+    """
+    Write positions (key -> (move, value)) as a table at half load factor
+
+    :param path: str
+    :param board_size: int
+    :param positions: Dict[int, Tuple[int, int]]
+    """
+    slots_count = 1
+    while slots_count < 2 * len(positions):
+        slots_count *= 2
+
+    slots = bytearray(SLOT.size * slots_count)
+    mask = slots_count - 1
+    for key, (move, value) in positions.items():
+        index = key & mask
+        while SLOT.unpack_from(slots, index * SLOT.size)[0] != 0:
+            index = (index + 1) & mask
+        SLOT.pack_into(slots, index * SLOT.size, key, move, value)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, board_size, slots_count))
+        f.write(slots)
+
+
+class PerfectPlayTable:
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.board_size, self.slots_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a perfect-play table (version {VERSION})')
+
+        self._mask = self.slots_count - 1
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int]]:
+        """
+        :param key: int, as built by position_key
+
+        :return: Optional[Tuple[int, int]], the best move and the value of the position, None if unknown
+        """
+        index = key & self._mask
+        while True:
+            slot_key, move, value = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if slot_key == key:
+                return move, value
+            if slot_key == 0:
+                return None
+            index = (index + 1) & self._mask
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        for index in range(self.slots_count):
+            slot_key, move, value = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if slot_key:
+                yield slot_key, move, value
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,58 @@
+from random import Random
+from typing import Optional, Union
+
+from engines.case_engine import CaseEngine
+from engines.mcts_engine import SearchState
+from engines.perfect_play import PerfectPlayTable, canonical_position_key, map_search_move
+from engines.zobrist import invert
+from facades import MarkMove, Board, CollapseMove, Engine
+from settings import PERFECT_PLAY_TABLE_PATH
+
+
+class TableEngine(CaseEngine):
+    """
+        CaseEngine rules, the AI answering with the best move found in the perfect-play table written by solver.py.
+        The table is memory-mapped on first use; positions it does not know (or a missing table, a table solved
+        for another board size, a game won with fewer marks in a row than the board size) fall back to a random move.
+    """
+    _ENGINE = Engine.TABLE.value
+
+    def __init__(self, board_size: int, table_path: str = PERFECT_PLAY_TABLE_PATH):
+        super().__init__(board_size)
+        self.table_path = table_path
+        self._table: Optional[PerfectPlayTable] = None
+        self._table_missing = False
+
+    @property
+    def table(self) -> Optional[PerfectPlayTable]:
+        if self._table is None and not self._table_missing:
+            try:
+                table = PerfectPlayTable(self.table_path)
+            except FileNotFoundError:
+                self._table_missing = True
+                return None
+
+            if table.board_size != self.board_size:
+                table.close()
+                self._table_missing = True
+                return None
+
+            self._table = table
+
+        return self._table
+
+    def _get_ai_move(self, board: Board, rng: Random) -> Optional[Union[MarkMove, CollapseMove]]:
+        entry = None
+        if self.table is not None and board.win_length in (None, board.board_size):
+            key, permutation = canonical_position_key(SearchState.from_board(board))
+            entry = self.table.lookup(key)
+
+        if entry is None:
+            return super()._get_ai_move(board, rng)
+
+        # the table move is given in the canonical orientation of the board
+        move = map_search_move(entry[0], invert(permutation))
+        if move < 0:
+            return CollapseMove(-1 - move)
+
+        return MarkMove(*divmod(move, len(board.cells)))
@@ -0,0 +1,205 @@
+"""
+    Zobrist hashing of boards: every (cell, mark, collapsed-state) gets a fixed random 64 bits key
+    and a board hashes to the XOR of the keys of its marks, so placing or removing a mark updates the hash
+    with a single XOR.
+
+    Boards differing by a symmetry keeping the winner (see get_key_symmetries) are strategically identical:
+    canonical_hash picks the minimal hash over those symmetries, moves and boards being mapped back through the
+    chosen one. get_symmetries gives the 8 rotations/reflections of the square as cell permutations.
+"""
+from array import array
+from functools import lru_cache
+from hashlib import blake2b
+from typing import List, Optional, Sequence, Tuple, Union
+
+from facades import Board, Cell, Mark, MarkMove, CollapseMove
+from settings import PLAYER_1, PLAYER_2
+
+Permutation = Tuple[int, ...]
+
+# keys of the marks of the first KEY_TABLE_ROUNDS_PER_CELL rounds per cell are precomputed in one flat table,
+# a game rarely lasting longer
+KEY_TABLE_ROUNDS_PER_CELL = 2
+
+
+@lru_cache(maxsize=65536)
+def zobrist_key(board_size: int, cell_index: int, player_id: str, round_index: int, collapsed: bool) -> int:
+    return _derive_key(board_size, cell_index, player_id, round_index, collapsed)
+
+
+def _derive_key(board_size: int, cell_index: int, player_id: str, round_index: int, collapsed: bool) -> int:
+    # derived from a hash rather than drawn from random so that every process agrees on keys
+    seed = f'{board_size}:{cell_index}:{player_id}:{round_index}:{int(collapsed)}'.encode()
+
+    return int.from_bytes(blake2b(seed, digest_size=8).digest(), 'little')
+
+
+@lru_cache(maxsize=None)
+def get_key_table(board_size: int) -> array:
+    """
+    zobrist_key of the marks of the first KEY_TABLE_ROUNDS_PER_CELL rounds per cell, each played by the player of its
+    round, at index ((round_index - 1) * cells_count + cell_index) * 2 + collapsed
+
+    :param board_size: int
+
+    :return: array, of unsigned 64 bits ints
+    """
+    cells_count = board_size * board_size
+    keys = array('Q')
+    for round_index in range(1, KEY_TABLE_ROUNDS_PER_CELL * cells_count + 1):
+        player_id = PLAYER_1 if round_index % 2 != 0 else PLAYER_2
+        for cell_index in range(cells_count):
+            keys.append(_derive_key(board_size, cell_index, player_id, round_index, False))
+            keys.append(_derive_key(board_size, cell_index, player_id, round_index, True))
+
+    return keys
+
+
+def mark_key(board_size: int, cell_index: int, mark: Mark, collapsed: bool) -> int:
+    round_index = mark.round_index
+    keys = get_key_table(board_size)
+    index = ((round_index - 1) * board_size * board_size + cell_index) * 2 + collapsed
+    # marks of later rounds, or not played by the player of their round (on a board yet to be validated)
+    if round_index < 1 or index >= len(keys) or mark.player_id != (PLAYER_1 if round_index % 2 != 0 else PLAYER_2):
+        return zobrist_key(board_size, cell_index, mark.player_id, round_index, collapsed)
+
+    return keys[index]
+
+
+def board_hash(board: Board) -> int:
+    return board_hashes(board, (tuple(range(len(board.cells))),))[0]
+
+
+@lru_cache(maxsize=None)
+def get_symmetries(board_size: int) -> Tuple[Permutation, ...]:
+    """
+    The 8 symmetries of the square as cell permutations, permutation[i] being where cell i goes, identity first
+
+    :param board_size: int
+
+    :return: Tuple[Permutation, ...]
+    """
+    last = board_size - 1
+    transforms = [
+        lambda r, c: (r, c),
+        lambda r, c: (c, last - r),
+        lambda r, c: (last - r, last - c),
+        lambda r, c: (last - c, r),
+        lambda r, c: (r, last - c),
+        lambda r, c: (last - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (last - c, last - r),
+    ]
+
+    symmetries: List[Permutation] = []
+    for transform in transforms:
+        permutation = []
+        for index in range(board_size * board_size):
+            r, c = transform(*divmod(index, board_size))
+            permutation.append(r * board_size + c)
+        symmetries.append(tuple(permutation))
+
+    return tuple(symmetries)
+
+
+@lru_cache(maxsize=None)
+def get_key_symmetries(board_size: int, win_length: Optional[int] = None) -> Tuple[Permutation, ...]:
+    """
+    The symmetries of the square under which positions are equivalent: when a collapse completes lines of both players,
+    the owner of the first line (rows, then columns, then diagonals, each from the top, see first_line_owner) wins,
+    which rotations and reflections but the transposition change. The transposition keeps it for lines as long as
+    the board only, lines of the two players then being parallel.
+
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, board_size when None
+
+    :return: Tuple[Permutation, ...], identity first
+    """
+    symmetries = get_symmetries(board_size)
+    if (win_length or board_size) != board_size:
+        return symmetries[:1]
+
+    # (r, c) -> (c, r)
+    return symmetries[0], symmetries[6]
+
+
+def invert(permutation: Permutation) -> Permutation:
+    inverse = [0] * len(permutation)
+    for index, image in enumerate(permutation):
+        inverse[image] = index
+
+    return tuple(inverse)
+
+
+def board_hashes(board: Board, symmetries: Sequence[Permutation]) -> List[int]:
+    """
+    Hash board under each symmetry, reading its cells once
+
+    :param board: Board
+    :param symmetries: Sequence[Permutation]
+
+    :return: List[int], the hash of board under each of symmetries
+    """
+    size = board.board_size
+    hashes = [0] * len(symmetries)
+
+    for index, cell in enumerate(board.cells):
+        marks = [(mark, False) for mark in cell.quantic_marks]
+        if cell.collapsed_mark is not None:
+            marks.append((cell.collapsed_mark, True))
+
+        for i, permutation in enumerate(symmetries):
+            target = permutation[index]
+            for mark, collapsed in marks:
+                hashes[i] ^= mark_key(size, target, mark, collapsed)
+
+    return hashes
+
+
+def canonical_hash(board: Board) -> Tuple[int, Permutation]:
+    """
+    Hash board in its canonical orientation: the symmetry keeping the winner giving the minimal hash
+
+    :param board: Board
+
+    :return: Tuple[int, Permutation], the canonical hash and the permutation taking board to its canonical orientation
+    """
+    symmetries = get_key_symmetries(board.board_size, board.win_length)
+
+    return min(zip(board_hashes(board, symmetries), symmetries))
+
+
+def map_move(move: Union[MarkMove, CollapseMove], permutation: Permutation) -> Union[MarkMove, CollapseMove]:
+    """
+    Apply a permutation to the cells of a move, e.g. invert(permutation) of canonical_hash
+    takes a move found on the canonical orientation back to the board
+
+    :param move: Union[MarkMove, CollapseMove]
+    :param permutation: Permutation
+
+    :return: Union[MarkMove, CollapseMove]
+    """
+    if isinstance(move, MarkMove):
+        return MarkMove(permutation[move.first_cell], permutation[move.second_cell])
+
+    return CollapseMove(permutation[move.selected_cell])
+
+
+def map_board(board: Board, permutation: Permutation) -> Board:
+    """
+    Apply a permutation to the cells of a board, sharing them with it (cells are never mutated once built)
+
+    :param board: Board
+    :param permutation: Permutation
+
+    :return: Board
+    """
+    cells: List[Optional[Cell]] = [None] * len(board.cells)
+    for index, cell in enumerate(board.cells):
+        cells[permutation[index]] = cell
+
+    pending = board.cells_indexes_to_be_collapsed
+    if pending is not None:
+        pending = (permutation[pending[0]], permutation[pending[1]])
+
+    return Board(cells, board.board_size, pending, board.engine, board.win_length, board.collapses)
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from facades import Board
 
 
@@ -6,9 +8,13 @@ class InvalidMoveException(Exception):
 
 
 class GameIsOverException(Exception):
-    def __init__(self, board: Board, winner_id: str):
+    def __init__(self, board: Board, winner_id: str, move_log: Optional[str] = None):
         self.board = board
         self.winner_id = winner_id
+        # log of the finished game, when it was played from a move log
+        self.move_log = move_log
+        # indexes of the cells the last moves wrote, when a delta is to be answered
+        self.changed_cells: Optional[List[int]] = None
 
 
 class InvalidEngineException(Exception):
@@ -17,3 +23,12 @@ class InvalidEngineException(Exception):
 
 class InvalidBoardException(Exception):
     pass
+
+
+class InvalidBoardSizeException(Exception):
+    pass
+
+
+# the board of a request does not have the board hash it was sent with (If-Match precondition)
+class StaleBoardException(InvalidBoardException):
+    pass
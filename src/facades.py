@@ -1,12 +1,27 @@
+from dataclasses import field
 from enum import Enum
 from typing import List, Optional, Tuple
 
+from marshmallow import ValidationError
 from marshmallow_dataclass import dataclass, class_schema
 
 
 class Engine(Enum):
+    # the built-in engines: boards and requests carry the name of their engine, a plain string, engines of other
+    # packages being registered by name only (see configuration)
     DUMMY = 'DUMMY'
     CASE = 'CASE'
+    MCTS = 'MCTS'
+    TABLE = 'TABLE'
+
+
+def _validate_engine(name: str):
+    # imported on first use: configuration imports the engines, which import this module
+    from configuration import engine_names
+
+    names = engine_names()
+    if name not in names:
+        raise ValidationError(f"Must be one of: {', '.join(names)}.")
 
 
 @dataclass
@@ -33,23 +48,33 @@ class Board:
     cells: List[Cell]
     board_size: int
     cells_indexes_to_be_collapsed: Optional[Tuple[int, int]]
-    engine: Engine
+    # name of a registered engine, e.g. Engine.CASE.value
+    engine: str = field(metadata={'validate': _validate_engine})
+    # marks in a row needed to win, board_size when None
+    win_length: Optional[int] = None
+    # collapses resolved so far: players take turns at every move, a collapse included, so the player to move is
+    # given by the marks placed and this count, not by the round of the next mark
+    collapses: int = 0
 
 
 @dataclass
 class StartGameRequest:
-    engine: Engine
-
-
-StartGameRequestSchema = class_schema(StartGameRequest)()
+    engine: str = field(metadata={'validate': _validate_engine})
+    # settings.BOARD_SIZE when None
+    board_size: Optional[int] = None
+    # board_size when None
+    win_length: Optional[int] = None
 
 
 @dataclass
 class StartGameResponse:
     board: Board
-
-
-StartGameResponseSchema = class_schema(StartGameResponse)()
+    # signature of board, to be sent back as previous_board_token
+    board_token: Optional[str] = None
+    # moves leading to board, to be sent back as move_log instead of previous_board
+    move_log: Optional[str] = None
+    # hash of board, to be sent back in an If-Match header (or as previous_board_hash) with board or move_log
+    board_hash: Optional[str] = None
 
 
 @dataclass
@@ -67,16 +92,99 @@ class CollapseMove:
 class PlayMoveRequest:
     mark_move: Optional[MarkMove]
     collapse_move: Optional[CollapseMove]
-    previous_board: Board
+    # the board is replayed from move_log when None
+    previous_board: Optional[Board]
+    # board_token received with previous_board, lets the server skip checking a board it issued
+    previous_board_token: Optional[str] = None
+    # move_log received with the previous board, a much smaller payload than previous_board
+    move_log: Optional[str] = None
+    # board_hash received with the previous board (or the If-Match header): the request fails with 412 when
+    # previous_board (or the board of move_log) does not have it
+    previous_board_hash: Optional[str] = None
+    # answer board_delta instead of board
+    delta: bool = False
 
 
-PlayMoveRequestSchema = class_schema(PlayMoveRequest)()
+@dataclass
+class ChangedCell:
+    index: int
+    cell: Cell
+
+
+@dataclass
+class BoardDelta:
+    # cells the moves wrote
+    changed_cells: List[ChangedCell]
+    cells_indexes_to_be_collapsed: Optional[Tuple[int, int]]
+    collapses: int = 0
 
 
 @dataclass
 class PlayMoveResponse:
-    board: Board
+    # None when the request asked for a delta
+    board: Optional[Board]
     winner: Optional[str]
+    board_token: Optional[str] = None
+    # only when the request was sent with a move_log
+    move_log: Optional[str] = None
+    board_hash: Optional[str] = None
+    # only when the request asked for it: the previous board updated with it is board
+    board_delta: Optional[BoardDelta] = None
 
 
-PlayMoveResponseSchema = class_schema(PlayMoveResponse)()
+@dataclass
+class PlayMoveBatchRequest:
+    requests: List[PlayMoveRequest]
+
+
+@dataclass
+class PlayMoveBatchItem:
+    # HTTP status /games/play would have answered this request with
+    status: int
+    response: Optional[PlayMoveResponse] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class PlayMoveBatchResponse:
+    responses: List[PlayMoveBatchItem]
+
+
+@dataclass
+class LegalMovesRequest:
+    # the board is replayed from move_log when given, as in PlayMoveRequest
+    board: Optional[Board] = None
+    board_token: Optional[str] = None
+    move_log: Optional[str] = None
+
+
+@dataclass
+class LegalMovesResponse:
+    # cells of the pending collapse, each of them being a legal CollapseMove
+    collapse_cells: List[int]
+    # when no collapse is pending, the uncollapsed cells: any two of them make a legal MarkMove
+    mark_cells: List[int]
+
+
+# marshmallow schema of each dataclass, built on first access to facades.<name> (e.g. PlayMoveRequestSchema):
+# building them takes most of the import time of this module, and FastCodec does not need them
+_SCHEMAS = {
+    'StartGameRequestSchema': StartGameRequest,
+    'StartGameResponseSchema': StartGameResponse,
+    'PlayMoveRequestSchema': PlayMoveRequest,
+    'PlayMoveResponseSchema': PlayMoveResponse,
+    'PlayMoveBatchRequestSchema': PlayMoveBatchRequest,
+    'PlayMoveBatchItemSchema': PlayMoveBatchItem,
+    'PlayMoveBatchResponseSchema': PlayMoveBatchResponse,
+    'LegalMovesRequestSchema': LegalMovesRequest,
+    'LegalMovesResponseSchema': LegalMovesResponse,
+}
+
+
+def __getattr__(name: str):
+    if name not in _SCHEMAS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    schema = globals()[name] = class_schema(_SCHEMAS[name])()
+
+    return schema
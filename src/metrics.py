@@ -0,0 +1,248 @@
+"""
+    Per-stage latency of /games/play requests: each request gets a StageTimer whose laps (load, check_move,
+    update_board, ai_move, dump, ...) are aggregated into histograms per engine and move type, exported in
+    Prometheus text format on /metrics.
+
+    When METRICS_ENABLED is False every request shares NULL_TIMER, whose methods do nothing.
+
+    A PROFILE_SAMPLE_RATE fraction of the timed requests also runs under cProfile, the PROFILE_SLOWEST slowest
+    of them being kept with their profile for /metrics/slowest.
+"""
+import cProfile
+import heapq
+import io
+import pstats
+import random
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+
+from settings import METRICS_ENABLED, METRICS_BUCKETS, PROFILE_SAMPLE_RATE, PROFILE_SLOWEST
+
+# functions listed for each profiled request
+PROFILE_FUNCTIONS = 25
+
+Labels = Tuple[str, ...]
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [count per bucket (the last one being +Inf), sum]
+        self._series: Dict[Labels, list] = {}
+        self._lock = Lock()
+
+    def observe(self, labels: Labels, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+
+        with self._lock:
+            series = sorted((labels, counts[:], total) for labels, (counts, total) in self._series.items())
+
+        for labels, counts, total in series:
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulated += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulated}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total!r}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulated}')
+
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_SECONDS = Histogram(
+    'quantic_play_stage_seconds', 'Time spent in each stage of /games/play', ('stage', 'engine', 'move'),
+    METRICS_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'quantic_play_request_seconds', 'Time spent handling /games/play', ('engine', 'move'), METRICS_BUCKETS
+)
+
+# exported alongside the histograms: name -> (type, help, function returning the value)
+GAUGES: Dict[str, Tuple[str, str, Callable[[], float]]] = {}
+
+
+class NullTimer:
+    """
+        Timer of the requests when metrics are disabled: does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> 'NullTimer':
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def lap(self, stage: str):
+        pass
+
+    def set_labels(self, engine: str, move: str):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+_CURRENT_TIMER: ContextVar = ContextVar('metrics_timer', default=NULL_TIMER)
+
+
+class StageTimer(NullTimer):
+    """
+        Times the stages of one request: lap(stage) charges the time elapsed since the previous lap to stage
+    """
+
+    __slots__ = ('stages', 'engine', 'move', '_started_at', '_last_lap', '_profiler', '_token')
+
+    def __init__(self, profile: bool = False):
+        self.stages: Dict[str, float] = {}
+        self.engine = 'none'
+        self.move = 'none'
+        self._profiler = cProfile.Profile() if profile else None
+        self._token = None
+        self._started_at = self._last_lap = 0.0
+
+    def __enter__(self) -> 'StageTimer':
+        self._token = _CURRENT_TIMER.set(self)
+        if self._profiler is not None:
+            self._profiler.enable()
+        self._started_at = self._last_lap = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self._started_at
+        if self._profiler is not None:
+            self._profiler.disable()
+        _CURRENT_TIMER.reset(self._token)
+
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe((stage, self.engine, self.move), seconds)
+        REQUEST_SECONDS.observe((self.engine, self.move), duration)
+
+        if self._profiler is not None:
+            SLOWEST.offer(duration, self)
+
+        return False
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last_lap
+        self._last_lap = now
+
+    def set_labels(self, engine: str, move: str):
+        self.engine = engine
+        self.move = move
+
+    def report(self) -> str:
+        text = io.StringIO()
+        pstats.Stats(self._profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_FUNCTIONS)
+
+        return text.getvalue()
+
+
+class SlowestRequests:
+    """
+        The `size` slowest profiled requests, with their stages and profile
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        # min heap of (duration, sequence, stages, engine, move, profile report)
+        self._heap: List[tuple] = []
+        self._sequence = 0
+        self._lock = Lock()
+
+    def offer(self, duration: float, timer: StageTimer):
+        with self._lock:
+            if len(self._heap) >= self.size and duration <= self._heap[0][0]:
+                return
+            self._sequence += 1
+            sequence = self._sequence
+
+        # rendering the profile is slow, do it out of the lock and only for the requests kept
+        entry = (duration, sequence, dict(timer.stages), timer.engine, timer.move, timer.report())
+
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def dump(self) -> str:
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+
+        blocks = []
+        for duration, _, stages, engine, move, report in entries:
+            stages_text = ', '.join(f'{stage} {seconds * 1000:.3f}ms' for stage, seconds in stages.items())
+            blocks.append(f'=== {duration * 1000:.3f}ms engine={engine} move={move}\n{stages_text}\n{report}')
+
+        return '\n'.join(blocks)
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+SLOWEST = SlowestRequests(PROFILE_SLOWEST)
+
+
+def request_timer() -> NullTimer:
+    """
+    Timer of a new request, to be used as a context manager
+
+    :return: NullTimer, NULL_TIMER when metrics are disabled
+    """
+    if not METRICS_ENABLED:
+        return NULL_TIMER
+
+    return StageTimer(PROFILE_SLOWEST > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def current_timer() -> NullTimer:
+    """
+    :return: NullTimer, the timer of the request being handled, NULL_TIMER if none
+    """
+    return _CURRENT_TIMER.get()
+
+
+def register_gauge(name: str, metric_type: str, help_text: str, function: Callable[[], float]):
+    GAUGES[name] = (metric_type, help_text, function)
+
+
+def expose() -> str:
+    """
+    :return: str, every metric in Prometheus text format
+    """
+    lines = STAGE_SECONDS.expose() + REQUEST_SECONDS.expose()
+
+    for name, (metric_type, help_text, function) in sorted(GAUGES.items()):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {function()!r}']
+
+    return '\n'.join(lines) + '\n'
+
+
+def slowest_requests() -> str:
+    return SLOWEST.dump()
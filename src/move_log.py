@@ -0,0 +1,198 @@
+"""
+    Move log: compact alternative to sending the whole previous_board back, the game being rebuilt by replaying
+    its moves from an empty board
+
+    url safe base64 (unpadded) of
+        version, board_size, win_length (0 for board_size), name length    header, one byte each
+        engine name                                                         ascii
+        first_cell, second_cell                                             a MarkMove
+        COLLAPSE, selected_cell                                             a CollapseMove
+        signature                                                           SIGNATURE_SIZE bytes
+
+    the moves of a log include the AI answers, which a client must not be able to choose: a log is signed like board
+    tokens (signing.sign of what precedes the signature, truncated) and verified before being replayed or looked up.
+    Boards of the logs this server issued are kept in a LRU cache, a log being replayed from its longest cached
+    prefix only
+"""
+import hmac
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from typing import List, Optional, Tuple, Union
+
+import signing
+from cache import LruCache
+from configuration import get_engine, is_engine_name
+from engines.cow_board import CopyOnWriteBoard
+from exceptions import InvalidBoardException, InvalidMoveException, InvalidBoardSizeException
+from facades import Board, Cell, CollapseMove, MarkMove
+from settings import MOVE_LOG_CACHE_SIZE, MOVE_LOG_CACHE_TTL, MIN_WIN_LENGTH
+
+VERSION = 3
+# fixed part of the header, the engine name following it
+HEADER_SIZE = 4
+MOVE_SIZE = 2
+# first bytes of the HMAC-SHA256, enough against forgery while keeping logs short
+SIGNATURE_SIZE = 16
+# first byte of a CollapseMove, larger than any cell index (MAX_BOARD_SIZE ** 2 - 1)
+COLLAPSE = 0xFF
+
+# header and moves bytes -> board they lead to
+REPLAY_CACHE = LruCache(MOVE_LOG_CACHE_SIZE, MOVE_LOG_CACHE_TTL)
+
+
+def _encode(data: bytes) -> str:
+    return urlsafe_b64encode(data + signing.sign(data)[:SIGNATURE_SIZE]).rstrip(b'=').decode()
+
+
+def _decode(log: str, verify: bool = True) -> bytes:
+    """
+    :param log: str
+    :param verify: bool, whether to check the signature of log
+
+    :return: bytes, the header and moves of log, without its signature
+
+    :raise InvalidBoardException
+    """
+    try:
+        signed = urlsafe_b64decode(log + '=' * (-len(log) % 4))
+    except (Base64Error, ValueError):
+        raise InvalidBoardException('move_log is not valid base64')
+
+    data, signature = signed[:-SIGNATURE_SIZE], signed[-SIGNATURE_SIZE:]
+    if len(data) < HEADER_SIZE or len(data) < _header_size(data) or (len(data) - _header_size(data)) % MOVE_SIZE:
+        raise InvalidBoardException('move_log is truncated')
+
+    if data[0] != VERSION:
+        raise InvalidBoardException(f'move_log version {data[0]} is not supported')
+
+    # constant time comparison, not to leak how much of a forged signature is right
+    if verify and not hmac.compare_digest(signing.sign(data)[:SIGNATURE_SIZE], signature):
+        raise InvalidBoardException('move_log was not issued by this server')
+
+    return data
+
+
+def _header_size(data: bytes) -> int:
+    return HEADER_SIZE + data[3]
+
+
+def _header(board: Board) -> bytes:
+    name = board.engine.encode()
+
+    return bytes((VERSION, board.board_size, board.win_length or 0, len(name))) + name
+
+
+def _read_header(data: bytes) -> Tuple[str, int, Optional[int]]:
+    name = data[HEADER_SIZE:_header_size(data)].decode(errors='replace')
+    if not is_engine_name(name):
+        raise InvalidBoardException(f'unknown engine {name} in move_log')
+
+    return name, data[1], data[2] or None
+
+
+def _moves_bytes(moves: List[Union[MarkMove, CollapseMove]]) -> bytes:
+    data = bytearray()
+    for move in moves:
+        if isinstance(move, MarkMove):
+            data += bytes((move.first_cell, move.second_cell))
+        else:
+            data += bytes((COLLAPSE, move.selected_cell))
+
+    return bytes(data)
+
+
+def _move(data: bytes, offset: int) -> Union[MarkMove, CollapseMove]:
+    if data[offset] == COLLAPSE:
+        return CollapseMove(data[offset + 1])
+
+    return MarkMove(data[offset], data[offset + 1])
+
+
+def new_log(board: Board, moves: List[Union[MarkMove, CollapseMove]]) -> str:
+    """
+    :param board: Board, the board moves lead to from an empty board
+    :param moves: List[Union[MarkMove, CollapseMove]]
+
+    :return: str, the log of moves
+    """
+    data = _header(board) + _moves_bytes(moves)
+    REPLAY_CACHE.put(data, board)
+
+    return _encode(data)
+
+
+def extend_log(log: str, moves: List[Union[MarkMove, CollapseMove]], board: Optional[Board]) -> str:
+    """
+    :param log: str, a valid log
+    :param moves: List[Union[MarkMove, CollapseMove]], moves played after log
+    :param board: Optional[Board], the board they lead to, None when they end the game (it is not cached)
+
+    :return: str, the log of the moves of log followed by moves
+    """
+    data = _decode(log) + _moves_bytes(moves)
+    if board is not None:
+        REPLAY_CACHE.put(data, board)
+
+    return _encode(data)
+
+
+def read_engine(log: str) -> Optional[str]:
+    """
+    :param log: str
+
+    :return: Optional[str], the engine name of log (its signature not being checked), None if it cannot be read
+    """
+    try:
+        return _read_header(_decode(log, verify=False))[0]
+    except InvalidBoardException:
+        return None
+
+
+def replay(log: str) -> Board:
+    """
+    Rebuild the board of a log, checking its signature then each of its moves
+
+    :param log: str
+
+    :return: Board
+
+    :raise InvalidBoardException, InvalidEngineException, InvalidBoardSizeException
+    """
+    data = _decode(log)
+
+    # longest replayed prefix, the whole log for one this server just issued
+    end = len(data)
+    board = REPLAY_CACHE.get(data)
+    if board is not None:
+        return board
+
+    header_size = _header_size(data)
+    while board is None and end > header_size:
+        end -= MOVE_SIZE
+        board = REPLAY_CACHE.get(data[:end])
+
+    engine_type, board_size, win_length = _read_header(data)
+    engine = get_engine(engine_type, board_size)
+    if board is None:
+        if win_length is not None and not MIN_WIN_LENGTH <= win_length <= board_size:
+            raise InvalidBoardSizeException(f'win_length must be between {MIN_WIN_LENGTH} and {board_size}')
+
+        board = Board([Cell([]) for _ in range(board_size * board_size)], board_size, None, engine_type, win_length)
+
+    # one board written by every replayed move: its cells are cloned, and its GameState built, once only
+    new_board = CopyOnWriteBoard(board)
+    for offset in range(end, len(data), MOVE_SIZE):
+        move = _move(data, offset)
+        try:
+            engine._check_move_validity(move, new_board.board)
+        except InvalidMoveException as e:
+            raise InvalidBoardException(f'move {(offset - header_size) // MOVE_SIZE} of move_log: {e}')
+
+        engine._update_board(move, new_board)
+
+        if engine._get_winner(new_board.board) is not None:
+            raise InvalidBoardException('move_log is a game already over')
+
+    REPLAY_CACHE.put(data, new_board.board)
+
+    return new_board.board
@@ -1,11 +1,30 @@
+"""
+    Command line client of the API
+
+    in `src/`
+
+        python play.py
+        python play.py --load --games 1000 --concurrency 16 --think-time 0.05
+        python play.py --load --board-size 9 --delta
+
+    the first form plays one interactive game, the second plays scripted games concurrently (load generation)
+    and reports throughput, latency percentiles and errors per endpoint
+"""
+import argparse
 import sys
-from typing import Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+from typing import Dict, List, Union, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from facades import StartGameResponseSchema, StartGameResponse, Engine, PlayMoveRequestSchema, PlayMoveRequest, \
-    MarkMove, Board, CollapseMove, PlayMoveResponseSchema, PlayMoveResponse
-from settings import PORT, HOSTNAME, PROTOCOL
+    MarkMove, Board, CollapseMove, PlayMoveResponseSchema, PlayMoveResponse, LegalMovesRequest, \
+    LegalMovesRequestSchema, LegalMovesResponse, LegalMovesResponseSchema, BoardDelta
+from settings import PORT, HOSTNAME, PROTOCOL, ENDPOINTS
 
 SIZE_CELL = 18
 
@@ -13,27 +32,101 @@ URL = f'{PROTOCOL}{HOSTNAME}:{PORT}'
 
 USE_DUMMY = False
 
+# keep-alive connections, reused from one request to the next
+SESSION = requests.Session()
 
-def play_move(previous_board: Board, move: Union[MarkMove, CollapseMove]) -> PlayMoveResponse:
-    r = requests.post(
-        f'{URL}/games/play', json=PlayMoveRequestSchema.dump(
+
+def start_game(
+        engine: str,
+        board_size: Optional[int] = None,
+        session: requests.Session = SESSION
+) -> StartGameResponse:
+    payload = {'engine': engine}
+    if board_size is not None:
+        payload['board_size'] = board_size
+
+    r = session.post(f'{URL}{ENDPOINTS.GAME_START.value}', json=payload)
+    if r.status_code != 200:
+        raise ApiError(ENDPOINTS.GAME_START.value, r)
+
+    return StartGameResponseSchema.load(r.json())
+
+
+def play_move(
+        previous_board: Board,
+        move: Union[MarkMove, CollapseMove],
+        board_token: Optional[str],
+        session: requests.Session = SESSION,
+        move_log: Optional[str] = None,
+        board_hash: Optional[str] = None,
+        delta: bool = False
+) -> PlayMoveResponse:
+    # the move log, when given, is sent instead of the board, the board hash being a precondition on either
+    if move_log is not None:
+        previous_board, board_token = None, None
+
+    r = session.post(
+        f'{URL}{ENDPOINTS.GAME_PLAY.value}', json=PlayMoveRequestSchema.dump(
             PlayMoveRequest(
                 move,
                 None,
-                previous_board
+                previous_board,
+                board_token,
+                move_log,
+                delta=delta
 
             ) if isinstance(move, MarkMove) else PlayMoveRequest(
                 None,
                 move,
-                previous_board
+                previous_board,
+                board_token,
+                move_log,
+                delta=delta
 
             )
-        )
+        ),
+        headers=None if board_hash is None else {'If-Match': f'"{board_hash}"'}
     )
+    if r.status_code != 200:
+        raise ApiError(ENDPOINTS.GAME_PLAY.value, r)
 
     return PlayMoveResponseSchema.load(r.json())
 
 
+def legal_moves(board: Board, board_token: Optional[str], session: requests.Session = SESSION) -> LegalMovesResponse:
+    r = session.post(
+        f'{URL}{ENDPOINTS.GAME_MOVES.value}',
+        json=LegalMovesRequestSchema.dump(LegalMovesRequest(board, board_token))
+    )
+    if r.status_code != 200:
+        raise ApiError(ENDPOINTS.GAME_MOVES.value, r)
+
+    return LegalMovesResponseSchema.load(r.json())
+
+
+def apply_delta(board: Board, delta: BoardDelta) -> Board:
+    """
+    :param board: Board, the previous board of a request
+    :param delta: BoardDelta, answered to it
+
+    :return: Board, the board answered
+    """
+    cells = list(board.cells)
+    for changed_cell in delta.changed_cells:
+        cells[changed_cell.index] = changed_cell.cell
+
+    return Board(
+        cells, board.board_size, delta.cells_indexes_to_be_collapsed, board.engine, board.win_length, delta.collapses
+    )
+
+
+class ApiError(Exception):
+    def __init__(self, endpoint: str, response: requests.Response):
+        super().__init__(f'{endpoint} answered {response.status_code}: {response.text}')
+        self.endpoint = endpoint
+        self.status_code = response.status_code
+
+
 def print_board(board: Board):
     for index, cell in enumerate(board.cells):
         if index % board.board_size == 0:
@@ -50,20 +143,16 @@ def print_board(board: Board):
     print('\n' + '-' * (SIZE_CELL + 1) * board.board_size)
 
 
-if __name__ == '__main__':
-
-    r = requests.post(f'{URL}/games/start', json={'engine': (Engine.DUMMY if USE_DUMMY else Engine.CASE).value})
-
-    if r.status_code != 200:
-        print(f'\033[91mERR : {r.json()["error"]}\033[0m')
+def play_interactive(engine: str):
+    try:
+        start_response = start_game(engine)
+    except ApiError as e:
+        print(f'\033[91mERR : {e}\033[0m')
 
         sys.exit(0)
 
-    start_response: StartGameResponse = StartGameResponseSchema.load(
-        r.json()
-    )
-
     board = start_response.board
+    board_token = start_response.board_token
 
     while True:
         print_board(board)
@@ -75,10 +164,15 @@ if __name__ == '__main__':
             )
             r = input('Type cell index :')
 
-            response = play_move(board, CollapseMove(int(r)))
+            response = play_move(board, CollapseMove(int(r)), board_token)
 
         else:
-            print('Which cells to mark ?')
+            mark_cells = legal_moves(board, board_token).mark_cells
+            if not mark_cells:
+                print('DRAW !')
+                sys.exit(0)
+
+            print(f'Which cells to mark among {", ".join(map(str, mark_cells))} ?')
             first = input(
                 f'first cell index :'
             )
@@ -86,7 +180,7 @@ if __name__ == '__main__':
                 f'second cell index :'
             )
 
-            response = play_move(board, MarkMove(int(first), int(second)))
+            response = play_move(board, MarkMove(int(first), int(second)), board_token)
 
         if response.winner:
 
@@ -95,3 +189,231 @@ if __name__ == '__main__':
             sys.exit(0)
         else:
             board = response.board
+            board_token = response.board_token
+
+
+def scripted_move(board: Board, rng: Random) -> Optional[Union[MarkMove, CollapseMove]]:
+    """
+    A random legal move on board
+
+    :param board: Board
+    :param rng: Random
+
+    :return: Optional[Union[MarkMove, CollapseMove]], None when the board is a draw
+    """
+    if board.cells_indexes_to_be_collapsed:
+        return CollapseMove(rng.choice(board.cells_indexes_to_be_collapsed))
+
+    free_cells = [index for index, cell in enumerate(board.cells) if cell.collapsed_mark is None]
+    if len(free_cells) < 2:
+        return None
+
+    return MarkMove(*rng.sample(free_cells, 2))
+
+
+class LoadStats:
+    """
+        Latencies, status codes and errors of the requests sent, per endpoint, shared by the load workers
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        # endpoint -> status code, or exception name when no response came -> count
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self.games = 0
+        self.outcomes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_request(self, endpoint: str, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error is not None:
+                errors = self.errors.setdefault(endpoint, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def add_game(self, outcome: str):
+        with self._lock:
+            self.games += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def report(self, elapsed: float) -> str:
+        requests_count = sum(len(latencies) for latencies in self.latencies.values())
+        lines = [
+            f'{self.games} games, {requests_count} requests in {elapsed:.1f}s '
+            f'({requests_count / max(elapsed, 1e-9):.0f} requests/s)',
+            '  ' + ', '.join(f'{outcome}: {count}' for outcome, count in sorted(self.outcomes.items())),
+        ]
+
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            errors = self.errors.get(endpoint, {})
+            errors_count = sum(errors.values())
+            lines.append(
+                f'{endpoint}: {len(latencies)} requests, {len(latencies) / max(elapsed, 1e-9):.0f}/s, '
+                f'p50 {_percentile(latencies, 0.5) * 1000:.2f}ms, p90 {_percentile(latencies, 0.9) * 1000:.2f}ms, '
+                f'p99 {_percentile(latencies, 0.99) * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms, '
+                f'errors {errors_count / len(latencies):.2%}'
+                + (f' ({", ".join(f"{error}: {count}" for error, count in sorted(errors.items()))})' if errors else '')
+            )
+
+        return '\n'.join(lines)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    # values are sorted
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _timed(stats: LoadStats, endpoint: str, call):
+    started_at = time.perf_counter()
+    try:
+        result = call()
+    except ApiError as e:
+        stats.add_request(endpoint, time.perf_counter() - started_at, str(e.status_code))
+        raise
+    except Exception as e:
+        stats.add_request(endpoint, time.perf_counter() - started_at, type(e).__name__)
+        raise
+
+    stats.add_request(endpoint, time.perf_counter() - started_at)
+
+    return result
+
+
+def play_scripted_game(
+        engine: str,
+        board_size: Optional[int],
+        seed: int,
+        think_time: float,
+        session: requests.Session,
+        stats: LoadStats,
+        use_move_log: bool = False,
+        use_delta: bool = False
+):
+    """
+    Play one game of random moves against the API, recording every request in stats
+
+    :param engine: str, engine name
+    :param board_size: Optional[int], settings.BOARD_SIZE of the server when None
+    :param seed: int, seed of the moves played
+    :param think_time: float, mean seconds waited before each move
+    :param session: requests.Session
+    :param stats: LoadStats
+    :param use_move_log: bool, send the move log instead of the board, asking for deltas (move logs are answered
+        without their board)
+    :param use_delta: bool, ask for deltas instead of boards, sending the hash of the board they rebuild (If-Match)
+    """
+    use_delta = use_delta or use_move_log
+    rng = Random(seed)
+    try:
+        response = _timed(
+            stats, ENDPOINTS.GAME_START.value, lambda: start_game(engine, board_size, session)
+        )
+        board, board_token, move_log = response.board, response.board_token, response.move_log
+        board_hash = response.board_hash
+
+        while True:
+            move = scripted_move(board, rng)
+            if move is None:
+                stats.add_game('draw')
+                return
+
+            if think_time > 0:
+                time.sleep(rng.expovariate(1 / think_time))
+
+            log = move_log if use_move_log else None
+            base_hash = board_hash if use_delta else None
+            response = _timed(
+                stats, ENDPOINTS.GAME_PLAY.value,
+                lambda: play_move(board, move, board_token, session, log, base_hash, use_delta)
+            )
+
+            if response.winner:
+                stats.add_game(f'{response.winner} won')
+                return
+
+            if response.board_delta is not None:
+                board = apply_delta(board, response.board_delta)
+            else:
+                board = response.board
+            board_token, move_log, board_hash = response.board_token, response.move_log, response.board_hash
+
+    except Exception:
+        stats.add_game('failed')
+
+
+def run_load(
+        engine: str,
+        games: int,
+        concurrency: int,
+        think_time: float = 0.0,
+        board_size: Optional[int] = None,
+        seed: int = 0,
+        use_move_log: bool = False,
+        use_delta: bool = False
+) -> LoadStats:
+    """
+    Play `games` scripted games against the API, concurrency of them at a time, game i being played from seed + i
+
+    :param engine: str, engine name
+    :param games: int
+    :param concurrency: int, games played at the same time, each worker keeping its connection alive
+    :param think_time: float, mean seconds waited before each move
+    :param board_size: Optional[int], settings.BOARD_SIZE of the server when None
+    :param seed: int
+    :param use_move_log: bool, send move logs instead of boards
+    :param use_delta: bool, ask for deltas instead of boards, sending board hashes as If-Match
+
+    :return: LoadStats
+    """
+    stats = LoadStats()
+    local = threading.local()
+
+    def play(game: int):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        play_scripted_game(engine, board_size, seed + game, think_time, session, stats, use_move_log, use_delta)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(play, range(games)))
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--engine', default=Engine.DUMMY.value if USE_DUMMY else Engine.CASE.value,
+        help='CASE, DUMMY, ...'
+    )
+    parser.add_argument('--load', action='store_true', help='play scripted games concurrently and report latencies')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds waited before each move')
+    parser.add_argument('--board-size', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--move-log', action='store_true', help='send move logs instead of previous boards')
+    parser.add_argument(
+        '--delta', action='store_true', help='ask for deltas instead of boards, sending board hashes as If-Match'
+    )
+    args = parser.parse_args()
+
+    if not args.load:
+        play_interactive(args.engine)
+        return
+
+    started_at = time.perf_counter()
+    stats = run_load(
+        args.engine, args.games, args.concurrency, args.think_time, args.board_size, args.seed, args.move_log,
+        args.delta
+    )
+    print(stats.report(time.perf_counter() - started_at))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+    Hand-written (de)serialization of the API payloads.
+
+    FastCodec produces the same JSON as the marshmallow schemas of facades.py (and as flask.jsonify:
+    sorted keys, compact separators, ASCII only, trailing new line) without building schema fields
+    for every nested Cell and Mark. MarshmallowCodec keeps the schema path selectable for comparison.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from marshmallow import ValidationError, fields
+
+import facades
+from facades import Board, Cell, Mark, MarkMove, CollapseMove, StartGameRequest, StartGameResponse, \
+    PlayMoveRequest, PlayMoveResponse, PlayMoveBatchItem, LegalMovesRequest, LegalMovesResponse, BoardDelta
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster JSON backend
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # let json raise the error the API has always returned
+            pass
+
+    return json.loads(data)
+
+
+def dumps(payload: Any) -> bytes:
+    """
+    Encode payload exactly like flask.jsonify does outside of debug mode
+
+    :param payload: Any
+
+    :return: bytes
+    """
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        # orjson does not escape non ASCII characters, json does
+        if body.isascii():
+            return body
+
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def _fail(path: List[str], message: str):
+    messages: Any = [message]
+    for key in reversed(path):
+        messages = {key: messages}
+
+    raise ValidationError(messages)
+
+
+def _object(data: Any, path: List[str], required: tuple, optional: tuple = ()) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        _fail(path, 'Invalid input type.')
+
+    for key in data:
+        if key not in required and key not in optional:
+            _fail(path + [key], 'Unknown field.')
+
+    for key in required:
+        if key not in data:
+            _fail(path + [key], 'Missing data for required field.')
+
+    return data
+
+
+def _int(value: Any, path: List[str]) -> int:
+    # same leniency as marshmallow's non strict Integer field
+    if isinstance(value, bool):
+        _fail(path, 'Not a valid integer.')
+
+    if isinstance(value, int):
+        return value
+
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        _fail(path, 'Not a valid integer.')
+
+    if isinstance(value, float) and number != value:
+        _fail(path, 'Not a valid integer.')
+
+    return number
+
+
+def _str(value: Any, path: List[str]) -> str:
+    if not isinstance(value, str):
+        _fail(path, 'Not a valid string.')
+
+    return value
+
+
+def _bool(value: Any, path: List[str]) -> bool:
+    # same leniency as marshmallow's Boolean field ('true', 'yes', 1, ...)
+    if value is None:
+        _fail(path, 'Field may not be null.')
+
+    try:
+        if value in fields.Boolean.truthy:
+            return True
+        if value in fields.Boolean.falsy:
+            return False
+    except TypeError:
+        pass
+
+    _fail(path, 'Not a valid boolean.')
+
+
+def _list(value: Any, path: List[str]) -> list:
+    if not isinstance(value, list):
+        _fail(path, 'Not a valid list.')
+
+    return value
+
+
+def _engine(value: Any, path: List[str]) -> str:
+    # imported on first use, as by facades: configuration imports the engines
+    from configuration import engine_names
+
+    value = _str(value, path)
+    names = engine_names()
+    if value not in names:
+        _fail(path, f"Must be one of: {', '.join(names)}.")
+
+    return value
+
+
+def mark_from_dict(data: Any, path: List[str]) -> Mark:
+    data = _object(data, path, ('player_id', 'round_index'))
+
+    return Mark(_str(data['player_id'], path + ['player_id']), _int(data['round_index'], path + ['round_index']))
+
+
+def mark_to_dict(mark: Mark) -> Dict[str, Any]:
+    return {'player_id': mark.player_id, 'round_index': mark.round_index}
+
+
+def cell_from_dict(data: Any, path: List[str]) -> Cell:
+    data = _object(data, path, ('quantic_marks',), ('collapsed_mark',))
+
+    marks_path = path + ['quantic_marks']
+    collapsed_mark = data.get('collapsed_mark')
+
+    return Cell(
+        [mark_from_dict(m, marks_path + [str(i)]) for i, m in enumerate(_list(data['quantic_marks'], marks_path))],
+        None if collapsed_mark is None else mark_from_dict(collapsed_mark, path + ['collapsed_mark'])
+    )
+
+
+def cell_to_dict(cell: Cell) -> Dict[str, Any]:
+    return {
+        'quantic_marks': [{'player_id': m.player_id, 'round_index': m.round_index} for m in cell.quantic_marks],
+        'collapsed_mark': None if cell.collapsed_mark is None else mark_to_dict(cell.collapsed_mark),
+    }
+
+
+def board_from_dict(data: Any, path: Optional[List[str]] = None) -> Board:
+    path = path or []
+    data = _object(
+        data, path, ('cells', 'board_size', 'engine'), ('cells_indexes_to_be_collapsed', 'win_length', 'collapses')
+    )
+
+    cells_path = path + ['cells']
+    to_be_collapsed = data.get('cells_indexes_to_be_collapsed')
+    if to_be_collapsed is not None:
+        indexes_path = path + ['cells_indexes_to_be_collapsed']
+        if not isinstance(to_be_collapsed, list) or len(to_be_collapsed) != 2:
+            _fail(indexes_path, 'Not a valid tuple.')
+        to_be_collapsed = (
+            _int(to_be_collapsed[0], indexes_path + ['0']),
+            _int(to_be_collapsed[1], indexes_path + ['1'])
+        )
+
+    win_length = data.get('win_length')
+    if win_length is not None:
+        win_length = _int(win_length, path + ['win_length'])
+
+    collapses = data.get('collapses', 0)
+    if collapses is None:
+        _fail(path + ['collapses'], 'Field may not be null.')
+
+    return Board(
+        [cell_from_dict(c, cells_path + [str(i)]) for i, c in enumerate(_list(data['cells'], cells_path))],
+        _int(data['board_size'], path + ['board_size']),
+        to_be_collapsed,
+        _engine(data['engine'], path + ['engine']),
+        win_length,
+        _int(collapses, path + ['collapses'])
+    )
+
+
+def board_delta_to_dict(delta: BoardDelta) -> Dict[str, Any]:
+    return {
+        'changed_cells': [{'index': c.index, 'cell': cell_to_dict(c.cell)} for c in delta.changed_cells],
+        'cells_indexes_to_be_collapsed': None if delta.cells_indexes_to_be_collapsed is None else list(
+            delta.cells_indexes_to_be_collapsed
+        ),
+        'collapses': delta.collapses,
+    }
+
+
+def board_to_dict(board: Board) -> Dict[str, Any]:
+    return {
+        'cells': [cell_to_dict(c) for c in board.cells],
+        'board_size': board.board_size,
+        'cells_indexes_to_be_collapsed': None if board.cells_indexes_to_be_collapsed is None else list(
+            board.cells_indexes_to_be_collapsed
+        ),
+        'engine': board.engine,
+        'win_length': board.win_length,
+        'collapses': board.collapses,
+    }
+
+
+class MarshmallowCodec:
+
+    def load_start_game_request(self, data: Any) -> StartGameRequest:
+        return facades.StartGameRequestSchema.load(data)
+
+    def load_play_move_request(self, data: Any) -> PlayMoveRequest:
+        return facades.PlayMoveRequestSchema.load(data)
+
+    def dump_start_game_response(self, response: StartGameResponse) -> Dict[str, Any]:
+        return facades.StartGameResponseSchema.dump(response)
+
+    def dump_play_move_response(self, response: PlayMoveResponse) -> Dict[str, Any]:
+        return facades.PlayMoveResponseSchema.dump(response)
+
+    def load_play_move_batch_request(self, data: Any) -> List[Any]:
+        """
+        Only check the envelope of a batch: its requests are loaded one by one so that an invalid one
+        only fails its own item
+
+        :return: List[Any], the requests, not loaded yet
+        """
+        data = _object(data, [], ('requests',))
+
+        return _list(data['requests'], ['requests'])
+
+    def dump_play_move_batch_item(self, item: PlayMoveBatchItem) -> Dict[str, Any]:
+        return facades.PlayMoveBatchItemSchema.dump(item)
+
+    def load_legal_moves_request(self, data: Any) -> LegalMovesRequest:
+        return facades.LegalMovesRequestSchema.load(data)
+
+    def dump_legal_moves_response(self, response: LegalMovesResponse) -> Dict[str, Any]:
+        return facades.LegalMovesResponseSchema.dump(response)
+
+
+class FastCodec(MarshmallowCodec):
+
+    def load_start_game_request(self, data: Any) -> StartGameRequest:
+        data = _object(data, [], ('engine',), ('board_size', 'win_length'))
+
+        board_size, win_length = data.get('board_size'), data.get('win_length')
+
+        return StartGameRequest(
+            _engine(data['engine'], ['engine']),
+            None if board_size is None else _int(board_size, ['board_size']),
+            None if win_length is None else _int(win_length, ['win_length'])
+        )
+
+    def load_play_move_request(self, data: Any) -> PlayMoveRequest:
+        data = _object(
+            data, [], (), (
+                'previous_board', 'mark_move', 'collapse_move', 'previous_board_token', 'move_log',
+                'previous_board_hash', 'delta'
+            )
+        )
+
+        mark_move = data.get('mark_move')
+        if mark_move is not None:
+            mark_move = _object(mark_move, ['mark_move'], ('first_cell', 'second_cell'))
+            mark_move = MarkMove(
+                _int(mark_move['first_cell'], ['mark_move', 'first_cell']),
+                _int(mark_move['second_cell'], ['mark_move', 'second_cell'])
+            )
+
+        collapse_move = data.get('collapse_move')
+        if collapse_move is not None:
+            collapse_move = _object(collapse_move, ['collapse_move'], ('selected_cell',))
+            collapse_move = CollapseMove(_int(collapse_move['selected_cell'], ['collapse_move', 'selected_cell']))
+
+        previous_board_token = data.get('previous_board_token')
+        if previous_board_token is not None:
+            previous_board_token = _str(previous_board_token, ['previous_board_token'])
+
+        previous_board = data.get('previous_board')
+        if previous_board is not None:
+            previous_board = board_from_dict(previous_board, ['previous_board'])
+
+        move_log = data.get('move_log')
+        if move_log is not None:
+            move_log = _str(move_log, ['move_log'])
+
+        previous_board_hash = data.get('previous_board_hash')
+        if previous_board_hash is not None:
+            previous_board_hash = _str(previous_board_hash, ['previous_board_hash'])
+
+        return PlayMoveRequest(
+            mark_move,
+            collapse_move,
+            previous_board,
+            previous_board_token,
+            move_log,
+            previous_board_hash,
+            _bool(data['delta'], ['delta']) if 'delta' in data else False
+        )
+
+    def dump_start_game_response(self, response: StartGameResponse) -> Dict[str, Any]:
+        return {
+            'board': board_to_dict(response.board),
+            'board_token': response.board_token,
+            'move_log': response.move_log,
+            'board_hash': response.board_hash,
+        }
+
+    def dump_play_move_response(self, response: PlayMoveResponse) -> Dict[str, Any]:
+        return {
+            'board': None if response.board is None else board_to_dict(response.board),
+            'winner': response.winner,
+            'board_token': response.board_token,
+            'move_log': response.move_log,
+            'board_hash': response.board_hash,
+            'board_delta': None if response.board_delta is None else board_delta_to_dict(response.board_delta),
+        }
+
+    def dump_play_move_batch_item(self, item: PlayMoveBatchItem) -> Dict[str, Any]:
+        return {
+            'status': item.status,
+            'response': None if item.response is None else self.dump_play_move_response(item.response),
+            'error': item.error,
+        }
+
+    def load_legal_moves_request(self, data: Any) -> LegalMovesRequest:
+        data = _object(data, [], (), ('board', 'board_token', 'move_log'))
+
+        board, board_token, move_log = data.get('board'), data.get('board_token'), data.get('move_log')
+
+        return LegalMovesRequest(
+            None if board is None else board_from_dict(board, ['board']),
+            None if board_token is None else _str(board_token, ['board_token']),
+            None if move_log is None else _str(move_log, ['move_log'])
+        )
+
+    def dump_legal_moves_response(self, response: LegalMovesResponse) -> Dict[str, Any]:
+        return {'collapse_cells': response.collapse_cells, 'mark_cells': response.mark_cells}
@@ -0,0 +1,291 @@
+"""
+    Prefork production server: the master process loads everything a request needs (engines, marshmallow schemas,
+    win-line masks, Zobrist keys, symmetry maps, perfect-play table) then forks the workers, which share those pages
+    copy-on-write and accept connections from the same listening socket, one request at a time each.
+
+    in `src/`
+
+        python server.py --workers 4 --max-requests 10000
+
+    signals to the master:
+        SIGHUP              graceful reload: the master executes itself again (loading the new code) on the same
+                            socket, forks new workers and then stops the old ones, which finish their request first
+        SIGTERM, SIGINT     graceful stop
+
+    a worker exits after --max-requests requests (plus a random jitter), the master forking a new one.
+    BOARD_SIGNING_KEY must be set for board tokens to stay valid across reloads.
+"""
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from settings import HOSTNAME, PORT, SERVER_WORKERS, SERVER_WARM_BOARD_SIZES, SERVER_MAX_REQUESTS, \
+    SERVER_MAX_REQUESTS_JITTER, SERVER_GRACEFUL_TIMEOUT, SERVER_ACCESS_LOG
+
+# set by a reloading master for the process it executes: listening socket and workers to stop once replaced
+LISTEN_FD_ENV = 'QUANTIC_SERVER_LISTEN_FD'
+OLD_WORKERS_ENV = 'QUANTIC_SERVER_OLD_WORKERS'
+# seconds between two checks of the stop flag by an idle worker, and of its workers by the master
+POLL_INTERVAL = 0.5
+
+
+def log(message: str):
+    print(f'[{os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+
+def memory_usage() -> str:
+    """
+    :return: str, resident and private memory of this process (Linux only)
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in smaps if line.endswith('kB\n')}
+    except OSError:
+        return 'memory usage unknown'
+
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+
+    return f'rss {fields.get("Rss", 0) / 1024:.1f}MiB, private {private / 1024:.1f}MiB'
+
+
+def warm_up(board_sizes=SERVER_WARM_BOARD_SIZES):
+    """
+    Load in this process what requests would otherwise load on first use, for the workers to inherit it
+    """
+    import facades
+    from configuration import engine_names, get_engine
+    from controller import APP
+    from engines.bitboard import get_line_starts, get_win_masks
+    from engines.table_engine import TableEngine
+    from engines.zobrist import get_key_symmetries, get_key_table, get_symmetries
+    from settings import MIN_WIN_LENGTH
+
+    for name in facades._SCHEMAS:
+        getattr(facades, name)
+
+    for board_size in board_sizes:
+        # engines of other packages included
+        for engine_type in engine_names():
+            engine = get_engine(engine_type, board_size)
+            # memory-maps the table, if any
+            if isinstance(engine, TableEngine):
+                engine.table
+
+        for win_length in range(MIN_WIN_LENGTH, board_size + 1):
+            get_line_starts(board_size, win_length)
+            get_win_masks(board_size, win_length)
+        get_win_masks(board_size)
+
+        get_symmetries(board_size)
+        get_key_symmetries(board_size)
+        for win_length in range(MIN_WIN_LENGTH, board_size):
+            get_key_symmetries(board_size, win_length)
+        get_key_table(board_size)
+
+    return APP
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # without keep-alive: an idle client would hold the worker
+    protocol_version = 'HTTP/1.0'
+
+    def log_request(self, *args, **kwargs):
+        if SERVER_ACCESS_LOG:
+            super().log_request(*args, **kwargs)
+
+
+class _WorkerServer(BaseWSGIServer):
+    # requests are served one at a time by each worker, the master running several workers
+    multiprocess = True
+
+    def __init__(self, app, listen_fd: int):
+        super().__init__(HOSTNAME, PORT, app, handler=_RequestHandler, fd=listen_fd)
+        # workers compete for connections: the ones losing the race must not block in accept()
+        self.socket.setblocking(False)
+        self.timeout = POLL_INTERVAL
+        self.requests_count = 0
+
+    def finish_request(self, request, client_address):
+        self.requests_count += 1
+        super().finish_request(request, client_address)
+
+
+def run_worker(app, listen_fd: int, max_requests: int, forked_at: float) -> int:
+    """
+    Serve requests until max_requests were served or SIGTERM / SIGINT is received
+
+    :return: int, exit status
+    """
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    server = _WorkerServer(app, listen_fd)
+    log(f'worker ready in {(time.perf_counter() - forked_at) * 1000:.1f}ms, {memory_usage()}')
+
+    while not stopping and server.requests_count < max_requests:
+        server.handle_request()
+
+    log(f'worker exiting after {server.requests_count} requests, {memory_usage()}')
+
+    return 0
+
+
+class Master:
+
+    def __init__(self, app, listener: socket.socket, workers: int, max_requests: int, max_requests_jitter: int):
+        self.app = app
+        self.listener = listener
+        self.workers_count = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        # pid -> fork time
+        self.workers: Dict[int, float] = {}
+        self._signals: List[int] = []
+
+    def spawn_worker(self):
+        max_requests = self.max_requests + random.randint(0, self.max_requests_jitter)
+        forked_at = time.perf_counter()
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                status = run_worker(self.app, self.listener.fileno(), max_requests, forked_at)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+
+        self.workers[pid] = forked_at
+
+    def reap_workers(self):
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+
+            if self.workers.pop(pid, None) is not None and os.waitstatus_to_exitcode(status) != 0:
+                log(f'worker {pid} exited with status {os.waitstatus_to_exitcode(status)}')
+
+    def stop_workers(self, pids: List[int]):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                        remaining.discard(pid)
+                except ChildProcessError:
+                    remaining.discard(pid)
+            time.sleep(0.05)
+
+        for pid in remaining:
+            log(f'killing worker {pid}')
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+        for pid in pids:
+            self.workers.pop(pid, None)
+
+    def reload(self):
+        """
+        Execute this program again, on the same listening socket, the current workers serving until it replaced them
+        When it cannot be executed (e.g. the interpreter was removed by an upgrade), this master serves on
+        """
+        log('reloading')
+        os.set_inheritable(self.listener.fileno(), True)
+        os.environ[LISTEN_FD_ENV] = str(self.listener.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(map(str, self.workers))
+
+        try:
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        except OSError as e:
+            log(f'reload failed, serving on with the current workers: {e}')
+            os.set_inheritable(self.listener.fileno(), False)
+            os.environ.pop(LISTEN_FD_ENV, None)
+            os.environ.pop(OLD_WORKERS_ENV, None)
+
+    def run(self, old_workers: Optional[List[int]] = None):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, _: self._signals.append(signum))
+
+        # what was loaded so far is shared by the workers: keep the collector from writing to it
+        gc.freeze()
+
+        for _ in range(self.workers_count):
+            self.spawn_worker()
+        log(f'{self.workers_count} workers serving on {HOSTNAME}:{PORT}, master {memory_usage()}')
+
+        # workers of the master this one replaced, still serving until now
+        if old_workers:
+            self.stop_workers(old_workers)
+
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    # only returns when the reload failed
+                    self.reload()
+                    continue
+
+                log('stopping')
+                self.stop_workers(list(self.workers))
+                return
+
+            self.reap_workers()
+            for _ in range(self.workers_count - len(self.workers)):
+                self.spawn_worker()
+
+            time.sleep(POLL_INTERVAL)
+
+
+def _listen() -> socket.socket:
+    listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if listen_fd is not None:
+        listener = socket.socket(fileno=int(listen_fd))
+        os.set_inheritable(listener.fileno(), False)
+        return listener
+
+    listener = socket.create_server((HOSTNAME, PORT), backlog=socket.SOMAXCONN)
+    listener.setblocking(False)
+
+    return listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--max-requests', type=int, default=SERVER_MAX_REQUESTS)
+    parser.add_argument('--max-requests-jitter', type=int, default=SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument('--board-sizes', type=int, nargs='+', default=SERVER_WARM_BOARD_SIZES)
+    args = parser.parse_args()
+
+    listener = _listen()
+    old_workers = [int(pid) for pid in os.environ.pop(OLD_WORKERS_ENV, '').split(',') if pid]
+
+    started_at = time.perf_counter()
+    app = warm_up(args.board_sizes)
+    log(f'warmed up in {(time.perf_counter() - started_at) * 1000:.0f}ms')
+
+    Master(app, listener, args.workers, args.max_requests, args.max_requests_jitter).run(old_workers)
+
+
+if __name__ == '__main__':
+    main()
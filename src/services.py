@@ -0,0 +1,467 @@
+"""
+    Request handling shared by every front end (controller, batch workers), independent from the web framework
+"""
+import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+import move_log
+import signing
+from cache import LruCache
+from configuration import get_engine
+from engines.bitboard import mask_cells
+from engines.zobrist import canonical_hash, invert, map_board, map_move
+from exceptions import InvalidEngineException, InvalidMoveException, GameIsOverException, InvalidBoardException, \
+    InvalidBoardSizeException, StaleBoardException
+from facades import PlayMoveRequest, PlayMoveResponse, PlayMoveBatchItem, StartGameRequest, StartGameResponse, \
+    Board, MarkMove, CollapseMove, LegalMovesRequest, LegalMovesResponse, BoardDelta, ChangedCell
+from metrics import current_timer, register_gauge, request_timer
+from serializers import FastCodec, MarshmallowCodec, dumps, loads
+from settings import USE_FAST_SERIALIZER, BATCH_POOL_WORKERS, BATCH_POOL_MIN_SIZE, GZIP_MIN_SIZE, \
+    GZIP_COMPRESS_LEVEL, SEED_AI_MOVES, PLAY_CACHE_SIZE, PLAY_CACHE_TTL, BOARD_SIZE, ACCEPT_UNSIGNED_BOARDS, \
+    PROCESS_POOL_START_METHOD
+
+CODEC = FastCodec() if USE_FAST_SERIALIZER else MarshmallowCodec()
+
+# (board, move) key -> (board, winner id, moves applied, cells written) played;
+# boards are never mutated once built, so they can be shared
+PLAY_CACHE = LruCache(PLAY_CACHE_SIZE, PLAY_CACHE_TTL)
+
+for name, metric_type, help_text, function in (
+    ('quantic_play_cache_hits_total', 'counter', 'Plays answered from the play cache', lambda: PLAY_CACHE.hits),
+    ('quantic_play_cache_misses_total', 'counter', 'Plays missing from the play cache', lambda: PLAY_CACHE.misses),
+    ('quantic_play_cache_evictions_total', 'counter', 'Plays evicted from the cache', lambda: PLAY_CACHE.evictions),
+    ('quantic_play_cache_expirations_total', 'counter', 'Plays expired in the cache', lambda: PLAY_CACHE.expirations),
+    ('quantic_play_cache_size', 'gauge', 'Plays held by the play cache', lambda: len(PLAY_CACHE)),
+    ('quantic_move_log_cache_hits_total', 'counter', 'Move logs replayed from the cache',
+     lambda: move_log.REPLAY_CACHE.hits),
+    ('quantic_move_log_cache_misses_total', 'counter', 'Move log prefixes missing from the cache',
+     lambda: move_log.REPLAY_CACHE.misses),
+):
+    register_gauge(name, metric_type, help_text, function)
+
+
+def encode_json(payload: Any, accepts_gzip: bool) -> Tuple[bytes, bool]:
+    """
+    Encode a response payload, gzipping it when large enough and accepted by the client
+
+    :return: Tuple[bytes, bool], the body and whether it is gzipped
+    """
+    body = dumps(payload)
+
+    if accepts_gzip and len(body) >= GZIP_MIN_SIZE:
+        return gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL), True
+
+    return body, False
+
+
+def start_game_request(req: StartGameRequest) -> StartGameResponse:
+    moves = []
+    board = get_engine(req.engine, req.board_size or BOARD_SIZE).start_game(win_length=req.win_length, moves=moves)
+    issued_hash = signing.board_hash(board)
+
+    return StartGameResponse(
+        board,
+        signing.sign_board_hash(issued_hash),
+        move_log.new_log(board, moves),
+        issued_hash
+    )
+
+
+def play_move_body(body: bytes, if_match: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Handle a /games/play request body, timing each stage of it (see metrics)
+
+    :param body: bytes
+    :param if_match: Optional[str], If-Match header of the request: the entity tag of a board hash, which is then
+        the previous_board_hash of the request
+
+    :return: Dict[str, Any], the dumped PlayMoveResponse, game over included
+
+    :raise InvalidMoveException, InvalidBoardException, StaleBoardException, InvalidEngineException, ValidationError
+    """
+    with request_timer() as timer:
+        data = loads(body)
+        base_hash = _if_match_hash(if_match)
+        if base_hash is not None:
+            _check_base_token(data, base_hash)
+
+        req = CODEC.load_play_move_request(data)
+        if base_hash is not None:
+            req.previous_board_hash = base_hash
+
+        if req.move_log is not None:
+            engine = move_log.read_engine(req.move_log)
+        else:
+            engine = None if req.previous_board is None else req.previous_board.engine
+        timer.set_labels(
+            'none' if engine is None else engine,
+            'mark' if req.mark_move is not None else 'collapse' if req.collapse_move is not None else 'none'
+        )
+        timer.lap('load')
+
+        try:
+            response = play_move_request(req)
+        except GameIsOverException as e:
+            response = game_over_response(e)
+
+        payload = CODEC.dump_play_move_response(response)
+        timer.lap('dump')
+
+        return payload
+
+
+def play_move_request(req: PlayMoveRequest) -> PlayMoveResponse:
+    """
+    Play the move of req and the AI answer, on the board of req.move_log when given (previous_board is then ignored),
+    which must have req.previous_board_hash when given
+
+    :param req: PlayMoveRequest
+
+    :return: PlayMoveResponse
+
+    :raise InvalidMoveException, InvalidBoardException, StaleBoardException, InvalidEngineException,
+        GameIsOverException
+    """
+    if req.collapse_move is None and req.mark_move is None:
+        raise InvalidMoveException('collapse_move and mark_move cannot both be null')
+
+    timer = current_timer()
+
+    previous_board, trusted_board = _request_board(
+        req.previous_board, req.previous_board_token, req.move_log, 'previous_board', req.previous_board_hash
+    )
+    # moves applied, to extend the move log with
+    moves = None if req.move_log is None else []
+    # cells written, to answer as a delta
+    changed_cells = [] if req.delta else None
+
+    move = req.mark_move or req.collapse_move
+    try:
+        board = _play_move(move, previous_board, trusted_board, moves, changed_cells)
+    except GameIsOverException as e:
+        if moves is not None:
+            e.move_log = move_log.extend_log(req.move_log, moves, None)
+        e.changed_cells = changed_cells
+        raise
+
+    issued_hash = signing.board_hash(board)
+    board_token = signing.sign_board_hash(issued_hash)
+    log = None if moves is None else move_log.extend_log(req.move_log, moves, board)
+    timer.lap('sign')
+
+    delta = None
+    if changed_cells is not None:
+        delta = _board_delta(board, changed_cells)
+        timer.lap('delta')
+
+    # a delta, or the move log, already gives the client its board
+    return PlayMoveResponse(
+        None if delta is not None or log is not None else board,
+        None,
+        board_token,
+        log,
+        issued_hash,
+        delta
+    )
+
+
+def _if_match_hash(if_match: Optional[str]) -> Optional[str]:
+    # a single entity tag, quoted or not, '*' (any board) being no precondition
+    if if_match is None:
+        return None
+
+    tag = if_match.strip().removeprefix('W/').strip('"')
+
+    return tag if tag not in ('', '*') else None
+
+
+def _check_base_token(data: Any, base_hash: str):
+    """
+    Check the token of a request against its If-Match board hash before the request is loaded, so that a request
+    not matching its precondition is rejected without deserializing its board
+
+    :param data: Any, the request as decoded from JSON
+    :param base_hash: str
+
+    :raise StaleBoardException
+    """
+    if not isinstance(data, dict) or data.get('move_log') is not None:
+        return
+
+    token = data.get('previous_board_token')
+    if isinstance(token, str) and not signing.verify_board_hash(base_hash, token):
+        raise StaleBoardException('previous_board_token is not the token of the If-Match board hash')
+
+
+def _board_delta(board: Board, changed_cells: List[int]) -> BoardDelta:
+    return BoardDelta(
+        [ChangedCell(index, board.cells[index]) for index in changed_cells],
+        board.cells_indexes_to_be_collapsed,
+        board.collapses
+    )
+
+
+def _request_board(
+        board: Optional[Board],
+        board_token: Optional[str],
+        log: Optional[str],
+        field: str,
+        expected_hash: Optional[str] = None
+) -> Tuple[Board, bool]:
+    """
+    The board a request is about: replayed from log when given, board otherwise
+
+    :param field: str, name of the board in the request, for error messages
+    :param expected_hash: Optional[str], board hash the board must have, when the request was sent with one
+
+    :return: Tuple[Board, bool], the board and whether it is known to be valid
+
+    :raise InvalidBoardException, StaleBoardException, InvalidEngineException, InvalidBoardSizeException
+    """
+    timer = current_timer()
+
+    if log is not None:
+        # the log is signed by this server, its signature being verified before it is replayed
+        board = move_log.replay(log)
+        timer.lap('replay')
+        if expected_hash is not None and signing.board_hash(board) != expected_hash:
+            raise StaleBoardException(f'move_log does not lead to the board of {field}_hash')
+        return board, True
+
+    if board is None:
+        raise InvalidBoardException(f'{field} or move_log is required')
+
+    if board_token is None and not ACCEPT_UNSIGNED_BOARDS:
+        raise InvalidBoardException(f'{field}_token is required')
+
+    # the hash is computed once, for both the precondition and the token
+    issued_hash = None if board_token is None and expected_hash is None else signing.board_hash(board)
+    if expected_hash is not None and issued_hash != expected_hash:
+        raise StaleBoardException(f'{field} does not match {field}_hash')
+
+    if board_token is None:
+        return board, False
+
+    if not signing.verify_board_hash(issued_hash, board_token):
+        raise InvalidBoardException(f'{field} does not match {field}_token')
+    timer.lap('verify_token')
+
+    return board, True
+
+
+def legal_moves_request(req: LegalMovesRequest) -> LegalMovesResponse:
+    """
+    :param req: LegalMovesRequest
+
+    :return: LegalMovesResponse, no move once the game is over
+
+    :raise InvalidBoardException, InvalidEngineException, InvalidBoardSizeException
+    """
+    board, trusted_board = _request_board(req.board, req.board_token, req.move_log, 'board')
+
+    engine = get_engine(board.engine, board.board_size)
+    if not trusted_board:
+        engine._check_board_validity(board)
+
+    if engine._get_winner(board) is not None:
+        return LegalMovesResponse([], [])
+
+    cells = mask_cells(engine.legal_cells_mask(board))
+    if board.cells_indexes_to_be_collapsed is not None:
+        return LegalMovesResponse(cells, [])
+
+    # a single uncollapsed cell cannot be marked
+    return LegalMovesResponse([], cells if len(cells) > 1 else [])
+
+
+def _play_key(move: Union[MarkMove, CollapseMove], board: Board) -> Hashable:
+    if isinstance(move, MarkMove):
+        move_key = (move.first_cell, move.second_cell)
+    else:
+        move_key = (move.selected_cell,)
+
+    # the 128 bits hash of the whole board (engine, win length and pending collapse included), not its Zobrist hash:
+    # two boards colliding would be answered the same
+    return signing.board_hash(board), move_key
+
+
+def _play_seed(key: Hashable) -> int:
+    # not hash(): string hashes are salted per process, batch workers and front ends must agree on seeds
+    return int.from_bytes(blake2b(repr(key).encode(), digest_size=8).digest(), 'little')
+
+
+def _play_move(
+        move: Union[MarkMove, CollapseMove],
+        board: Board,
+        trusted_board: bool,
+        moves: Optional[List[Union[MarkMove, CollapseMove]]] = None,
+        changed_cells: Optional[List[int]] = None
+) -> Board:
+    """
+    Play move on board through its engine, seeding the AI from (board, move) and answering from PLAY_CACHE when enabled
+    The moves applied (move and the AI answer) are appended to moves, the indexes of the cells written to
+    changed_cells, when given
+
+    Plays are seeded and cached in the canonical orientation of the board (zobrist.canonical_hash): a board and its
+    transposition share one entry, the board, moves and cells played being mapped back to the orientation of board
+
+    Only plays on trusted boards are cached: a hit skips the board check, which an untrusted board must go through
+
+    :raise InvalidMoveException, InvalidBoardException, InvalidEngineException, GameIsOverException
+    """
+    engine = get_engine(board.engine, board.board_size)
+    if not SEED_AI_MOVES:
+        return engine.play_move(move, board, trusted_board, moves=moves, changed_cells=changed_cells)
+
+    # checked as sent, for errors to name its cells (and a move out of the board not to be mapped), a won board being
+    # rejected before anything is played, cached or answered as a delta
+    timer = current_timer()
+    if not trusted_board:
+        engine._check_board_validity(board)
+        timer.lap('check_board')
+    engine._check_not_over(board)
+    engine._check_move_validity(move, board)
+    timer.lap('check_move')
+
+    _, permutation = canonical_hash(board)
+    canonical_board, canonical_move = map_board(board, permutation), map_move(move, permutation)
+    key = _play_key(canonical_move, canonical_board)
+    cacheable = PLAY_CACHE_SIZE > 0 and engine.DETERMINISTIC and trusted_board
+
+    played = PLAY_CACHE.get(key) if cacheable else None
+    timer.lap('play_cache')
+    if played is None:
+        played_moves, played_cells = [], []
+        try:
+            played = engine.play_move(
+                canonical_move, canonical_board, True, _play_seed(key), played_moves, played_cells
+            ), None
+        except GameIsOverException as e:
+            played = e.board, e.winner_id
+        played += (tuple(played_moves), tuple(played_cells))
+
+        if cacheable:
+            PLAY_CACHE.put(key, played)
+
+    new_board, winner_id, played_moves, played_cells = played
+    inverse = invert(permutation)
+    new_board = map_board(new_board, inverse)
+    if moves is not None:
+        moves.extend(map_move(played_move, inverse) for played_move in played_moves)
+    if changed_cells is not None:
+        changed_cells.extend(sorted(inverse[index] for index in played_cells))
+    if winner_id is not None:
+        raise GameIsOverException(new_board, winner_id)
+
+    return new_board
+
+
+def play_cache_stats() -> Dict[str, int]:
+    return PLAY_CACHE.stats()
+
+
+def game_over_response(e: GameIsOverException) -> PlayMoveResponse:
+    issued_hash = signing.board_hash(e.board)
+    delta = None if e.changed_cells is None else _board_delta(e.board, e.changed_cells)
+
+    return PlayMoveResponse(
+        None if delta is not None or e.move_log is not None else e.board,
+        e.winner_id,
+        signing.sign_board_hash(issued_hash),
+        e.move_log,
+        issued_hash,
+        delta
+    )
+
+
+def error_payload(e: Exception) -> Tuple[Dict[str, Any], int]:
+    """
+    Map an exception raised while handling a request (but GameIsOverException, which is not an error)
+    to the error payload and HTTP status answered
+
+    :param e: Exception
+
+    :return: Tuple[Dict[str, Any], int]
+    """
+    if isinstance(e, (InvalidMoveException, InvalidBoardSizeException)):
+        return {'error': str(e)}, 400
+
+    if isinstance(e, InvalidEngineException):
+        return {'error': str(e)}, 404
+
+    if isinstance(e, StaleBoardException):
+        return {'error': str(e)}, 412
+
+    if isinstance(e, InvalidBoardException):
+        return {'error': str(e)}, 404
+
+    return {'error': f"Server Error: {str(e)}"}, 500
+
+
+def play_batch_item(data: Any) -> Dict[str, Any]:
+    """
+    Load and play one request of a batch, its errors only failing its own item
+
+    :param data: Any, the request as decoded from JSON
+
+    :return: Dict[str, Any], the dumped PlayMoveBatchItem
+    """
+    try:
+        item = PlayMoveBatchItem(200, play_move_request(CODEC.load_play_move_request(data)))
+    except GameIsOverException as e:
+        item = PlayMoveBatchItem(200, game_over_response(e))
+    except Exception as e:
+        payload, status = error_payload(e)
+        item = PlayMoveBatchItem(status, None, payload['error'])
+
+    return CODEC.dump_play_move_batch_item(item)
+
+
+def _play_batch_chunk(chunk: List[Any]) -> List[Dict[str, Any]]:
+    return [play_batch_item(data) for data in chunk]
+
+
+def _init_batch_worker(signing_key: bytes):
+    # workers must sign with the key of the server, even when it was generated at startup
+    signing.BOARD_SIGNING_KEY = signing_key
+
+
+_BATCH_POOL: Optional[ProcessPoolExecutor] = None
+_BATCH_POOL_LOCK = Lock()
+
+
+def _get_batch_pool() -> ProcessPoolExecutor:
+    global _BATCH_POOL
+
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is None:
+            _BATCH_POOL = ProcessPoolExecutor(
+                max_workers=BATCH_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD),
+                initializer=_init_batch_worker,
+                initargs=(signing.BOARD_SIGNING_KEY,)
+            )
+
+    return _BATCH_POOL
+
+
+def play_move_batch(requests: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Play independent requests, large batches being spread over a process pool so they are not serialized by the GIL
+
+    :param requests: List[Any], requests as decoded from JSON
+
+    :return: List[Dict[str, Any]], the dumped PlayMoveBatchItem of each request, in the same order
+    """
+    if len(requests) < BATCH_POOL_MIN_SIZE or BATCH_POOL_WORKERS < 2:
+        return _play_batch_chunk(requests)
+
+    # a few chunks per worker: fewer round trips to the pool than one task per request, while still balancing load
+    chunk_size = -(-len(requests) // (BATCH_POOL_WORKERS * 4))
+    chunks = [requests[i:i + chunk_size] for i in range(0, len(requests), chunk_size)]
+
+    return [item for items in _get_batch_pool().map(_play_batch_chunk, chunks) for item in items]
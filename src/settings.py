@@ -1,10 +1,24 @@
+import os
+import secrets
 from enum import Enum
 
 BOARD_SIZE = 3
+# board sizes /games/start accepts, an engine being created for each size on first use
+MIN_BOARD_SIZE = 2
+MAX_BOARD_SIZE = 15
+# marks in a row needed to win, at most the board size (the default)
+MIN_WIN_LENGTH = 2
+
+# entry point group through which other packages provide engines, see configuration.py
+ENGINE_ENTRY_POINT_GROUP = 'quantic_tictactoe.engines'
 
 class ENDPOINTS(Enum):
     GAME_START = '/games/start'
     GAME_PLAY = '/games/play'
+    GAME_PLAY_BATCH = '/games/play/batch'
+    GAME_MOVES = '/games/moves'
+    METRICS = '/metrics'
+    METRICS_SLOWEST = '/metrics/slowest'
 
 
 PLAYER_1 = 'X'
@@ -13,3 +27,68 @@ PLAYER_2 = 'O'
 PROTOCOL = 'http://'
 HOSTNAME = '127.0.0.1'
 PORT = 8081
+
+# (de)serialize payloads with serializers.FastCodec, False falls back on the marshmallow schemas of facades.py
+USE_FAST_SERIALIZER = True
+# responses bigger than GZIP_MIN_SIZE bytes are gzipped for clients accepting it
+GZIP_MIN_SIZE = 2048
+GZIP_COMPRESS_LEVEL = 6
+
+# key signing the board tokens returned alongside boards, must be shared by every server process
+# (a random one is only valid for the lifetime of this process)
+BOARD_SIGNING_KEY = os.environ.get('BOARD_SIGNING_KEY', '').encode() or secrets.token_bytes(32)
+# boards sent without their board_token are rejected, a client could otherwise play from any consistent position it
+# made up; when True they are accepted once fully validated
+ACCEPT_UNSIGNED_BOARDS = False
+
+# batches of at least BATCH_POOL_MIN_SIZE requests are spread over BATCH_POOL_WORKERS processes
+BATCH_POOL_WORKERS = os.cpu_count() or 1
+BATCH_POOL_MIN_SIZE = 64
+BATCH_MAX_SIZE = 10000
+# start method of the batch and MCTS process pools, created on first use by a server already running threads:
+# a forked child would inherit locks other threads were holding, 'forkserver' (or 'spawn') starts clean processes
+PROCESS_POOL_START_METHOD = 'forkserver'
+
+# asgi.py runs engines on ASGI_EXECUTOR_WORKERS threads, answering 503 once ASGI_MAX_PENDING requests are waiting for them
+ASGI_EXECUTOR_WORKERS = 8
+ASGI_MAX_PENDING = 64
+ASGI_MAX_BODY_SIZE = 1024 * 1024
+
+# server.py: prefork production server, SERVER_WORKERS processes forked once engines and lookup tables of
+# SERVER_WARM_BOARD_SIZES are loaded, each one being replaced after SERVER_MAX_REQUESTS requests
+# (plus up to SERVER_MAX_REQUESTS_JITTER, so that workers are not all replaced at once)
+SERVER_WORKERS = os.cpu_count() or 1
+SERVER_WARM_BOARD_SIZES = (BOARD_SIZE,)
+SERVER_MAX_REQUESTS = 10000
+SERVER_MAX_REQUESTS_JITTER = 1000
+# seconds workers have to finish their request once asked to stop, before being killed
+SERVER_GRACEFUL_TIMEOUT = 30
+SERVER_ACCESS_LOG = False
+
+# MCTS engine: wall-clock budget of each AI move, spread over MCTS_WORKERS processes
+MCTS_TIME_BUDGET_MS = 200
+MCTS_WORKERS = os.cpu_count() or 1
+MCTS_EXPLORATION = 1.4
+
+# perfect-play table written by solver.py and memory-mapped by the TABLE engine
+PERFECT_PLAY_TABLE_PATH = os.environ.get('PERFECT_PLAY_TABLE_PATH', os.path.join(os.path.dirname(__file__), 'perfect_play.bin'))
+
+# the AI answer to a move is drawn from a random generator seeded with the board and the move,
+# so that the same request always gets the same answer
+SEED_AI_MOVES = True
+# answers of deterministic engines to seeded moves are kept in a LRU cache of PLAY_CACHE_SIZE entries
+# for PLAY_CACHE_TTL seconds, 0 disables the cache
+PLAY_CACHE_SIZE = 10000
+PLAY_CACHE_TTL = 3600
+# boards rebuilt from the move logs of /games/play (see move_log.py), kept in a LRU cache of MOVE_LOG_CACHE_SIZE
+# entries for MOVE_LOG_CACHE_TTL seconds
+MOVE_LOG_CACHE_SIZE = 10000
+MOVE_LOG_CACHE_TTL = 3600
+
+# per-stage timings of /games/play, exposed on /metrics in Prometheus text format
+METRICS_ENABLED = False
+METRICS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# when metrics are enabled, PROFILE_SAMPLE_RATE of the requests run under cProfile,
+# the PROFILE_SLOWEST slowest of them being listed on /metrics/slowest (0 disables profiling)
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_SLOWEST = 10
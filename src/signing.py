@@ -0,0 +1,56 @@
+import hmac
+import json
+from base64 import urlsafe_b64encode
+from hashlib import blake2b, sha256
+
+from facades import Board
+from serializers import board_to_dict
+from settings import BOARD_SIGNING_KEY
+
+
+def canonical_board(board: Board) -> bytes:
+    return json.dumps(board_to_dict(board), sort_keys=True, separators=(',', ':')).encode()
+
+
+def sign(data: bytes) -> bytes:
+    """
+    :param data: bytes
+
+    :return: bytes, HMAC-SHA256 of data under the key every server process shares
+    """
+    return hmac.new(BOARD_SIGNING_KEY, data, sha256).digest()
+
+
+def board_hash(board: Board) -> str:
+    """
+    Hash identifying a board (engine and win length included), the same in every server process
+
+    :param board: Board
+
+    :return: str, hex of the blake2b digest of the board canonical encoding
+    """
+    return blake2b(canonical_board(board), digest_size=16).hexdigest()
+
+
+def sign_board_hash(issued_hash: str) -> str:
+    """
+    Build the token proving the board of a hash was issued by this server
+
+    :param issued_hash: str, as built by board_hash
+
+    :return: str, url safe base64 of the HMAC-SHA256 of the hash
+    """
+    return urlsafe_b64encode(sign(issued_hash.encode())).rstrip(b'=').decode()
+
+
+def sign_board(board: Board) -> str:
+    return sign_board_hash(board_hash(board))
+
+
+def verify_board_hash(issued_hash: str, token: str) -> bool:
+    # constant time comparison, not to leak how much of a forged token is right
+    return hmac.compare_digest(sign_board_hash(issued_hash), token)
+
+
+def verify_board(board: Board, token: str) -> bool:
+    return verify_board_hash(board_hash(board), token)
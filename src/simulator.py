@@ -0,0 +1,288 @@
+"""
+    Headless self-play: plays complete games in-process between two move policies, spread over a process pool,
+    and aggregates outcomes, game lengths, collapses and the exceptions raised by the engine
+
+    in `src/`
+
+        python simulator.py --engine CASE --games 1000000
+        python simulator.py --engine CASE --replay 1234
+
+    every game is played from its own seed (--seed + game number), the second form replays one of them move by move
+"""
+import argparse
+import importlib
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from configuration import get_engine
+from engines.base_engine import BaseEngine
+from engines.cow_board import CopyOnWriteBoard
+from facades import Board, Cell, CollapseMove, Engine, MarkMove
+from settings import BOARD_SIZE
+
+# (engine, board, rng) -> move to play on board
+Policy = Callable[[BaseEngine, Board, Random], Union[MarkMove, CollapseMove]]
+
+DRAW = 'draw'
+# games still running after MAX_PLIES_PER_CELL moves per cell are stopped
+MAX_PLIES_PER_CELL = 4
+UNFINISHED = 'unfinished'
+# seeds of the games that raised a given exception kept for replay
+SEEDS_KEPT = 5
+GAMES_PER_TASK = 500
+
+
+def random_policy(engine: BaseEngine, board: Board, rng: Random) -> Union[MarkMove, CollapseMove]:
+    # the move the engine AI would play
+    return engine._get_ai_move(board, rng)
+
+
+POLICIES: Dict[str, Policy] = {
+    'random': random_policy,
+}
+
+
+def get_policy(name: str) -> Policy:
+    """
+    :param name: str, a key of POLICIES or `module:function`
+
+    :return: Policy
+    """
+    if name in POLICIES:
+        return POLICIES[name]
+
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f'unknown policy {name}, expected one of {", ".join(POLICIES)} or module:function')
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class GameResult:
+    __slots__ = ('seed', 'outcome', 'plies', 'collapses', 'error')
+
+    def __init__(self, seed: int, outcome: str, plies: int, collapses: int, error: Optional[str] = None):
+        self.seed = seed
+        # winner id, DRAW, UNFINISHED or the exception raised by the engine
+        self.outcome = outcome
+        self.plies = plies
+        self.collapses = collapses
+        self.error = error
+
+
+def play_game(
+        engine: BaseEngine,
+        policies: Tuple[Policy, Policy],
+        seed: int,
+        validate: bool = True,
+        verbose: bool = False,
+        win_length: Optional[int] = None
+) -> GameResult:
+    """
+    Play one game from an empty board, the first policy playing first; players take turns at every move, a collapse
+    included, as through BaseEngine.play_move
+
+    :param engine: BaseEngine
+    :param policies: Tuple[Policy, Policy]
+    :param seed: int
+    :param validate: bool, check the consistency of the board before each move
+    :param verbose: bool, print each move and the traceback of an error
+    :param win_length: Optional[int], marks in a row needed to win, the board size when None
+
+    :return: GameResult
+    """
+    rng = Random(seed)
+    cells_count = engine.board_size * engine.board_size
+    board = Board([Cell([]) for _ in range(cells_count)], engine.board_size, None, engine._ENGINE, win_length)
+
+    plies, collapses, turn = 0, 0, 0
+    try:
+        while plies < MAX_PLIES_PER_CELL * cells_count:
+            if next(engine.legal_moves(board), None) is None:
+                return GameResult(seed, DRAW, plies, collapses)
+
+            if validate:
+                engine._check_board_validity(board)
+
+            move = policies[turn](engine, board, rng)
+            engine._check_move_validity(move, board)
+
+            new_board = CopyOnWriteBoard(board)
+            engine._update_board(move, new_board)
+            board = new_board.board
+
+            plies += 1
+            turn = 1 - turn
+            if isinstance(move, CollapseMove):
+                collapses += 1
+
+            if verbose:
+                print(f'{plies:>3} {move}', file=sys.stderr)
+
+            winner = engine._get_winner(board)
+            if winner is not None:
+                return GameResult(seed, winner, plies, collapses)
+
+        return GameResult(seed, UNFINISHED, plies, collapses)
+
+    except Exception as e:
+        if verbose:
+            traceback.print_exc()
+
+        return GameResult(seed, f'{type(e).__name__}: {e}', plies, collapses, error=type(e).__name__)
+
+
+class SimulationStats:
+
+    def __init__(self):
+        self.games = 0
+        self.outcomes: Counter = Counter()
+        self.plies: Counter = Counter()
+        self.collapses = 0
+        # outcome of the failed games -> first seeds raising it
+        self.error_seeds: Dict[str, List[int]] = {}
+
+    def add(self, result: GameResult):
+        self.games += 1
+        self.outcomes[result.outcome] += 1
+        self.plies[result.plies] += 1
+        self.collapses += result.collapses
+
+        if result.error is not None:
+            seeds = self.error_seeds.setdefault(result.outcome, [])
+            if len(seeds) < SEEDS_KEPT:
+                seeds.append(result.seed)
+
+    def merge(self, other: 'SimulationStats'):
+        self.games += other.games
+        self.outcomes.update(other.outcomes)
+        self.plies.update(other.plies)
+        self.collapses += other.collapses
+
+        for outcome, seeds in other.error_seeds.items():
+            kept = self.error_seeds.setdefault(outcome, [])
+            kept.extend(seeds[:SEEDS_KEPT - len(kept)])
+
+    def plies_percentile(self, fraction: float) -> int:
+        threshold = fraction * self.games
+        seen = 0
+        for plies in sorted(self.plies):
+            seen += self.plies[plies]
+            if seen >= threshold:
+                return plies
+
+        return 0
+
+    def report(self, elapsed: float) -> str:
+        lines = [f'{self.games} games in {elapsed:.1f}s ({self.games / max(elapsed, 1e-9):.0f} games/s)']
+
+        for outcome, count in self.outcomes.most_common():
+            seeds = self.error_seeds.get(outcome)
+            lines.append(
+                f'  {outcome}: {count} ({count / self.games:.1%})' + (f', seeds {seeds}' if seeds else '')
+            )
+
+        total_plies = sum(plies * count for plies, count in self.plies.items())
+        lines.append(
+            f'plies per game: mean {total_plies / max(self.games, 1):.1f}, median {self.plies_percentile(0.5)}, '
+            f'p99 {self.plies_percentile(0.99)}, max {max(self.plies, default=0)}'
+        )
+        lines.append(f'collapses per game: {self.collapses / max(self.games, 1):.2f}')
+
+        return '\n'.join(lines)
+
+
+def _simulate(args: Tuple[str, int, Optional[int], str, str, int, int, bool]) -> SimulationStats:
+    engine_type, board_size, win_length, first_policy, second_policy, first_seed, games, validate = args
+
+    engine = get_engine(engine_type, board_size)
+    policies = (get_policy(first_policy), get_policy(second_policy))
+
+    stats = SimulationStats()
+    for seed in range(first_seed, first_seed + games):
+        stats.add(play_game(engine, policies, seed, validate, win_length=win_length))
+
+    return stats
+
+
+def simulate(
+        engine_type: str,
+        games: int,
+        board_size: int = BOARD_SIZE,
+        win_length: Optional[int] = None,
+        policies: Tuple[str, str] = ('random', 'random'),
+        seed: int = 0,
+        workers: int = 1,
+        validate: bool = True
+) -> SimulationStats:
+    """
+    Play games, game i being played from seed + i
+
+    :param engine_type: str, engine name
+    :param games: int
+    :param board_size: int
+    :param win_length: Optional[int], marks in a row needed to win, the board size when None
+    :param policies: Tuple[str, str], names of the policies of the first and second player, see get_policy
+    :param seed: int
+    :param workers: int, processes playing games, 1 plays them in this process
+    :param validate: bool, check the consistency of the board before each move
+
+    :return: SimulationStats
+    """
+    tasks = [
+        (
+            engine_type, board_size, win_length, policies[0], policies[1], seed + first,
+            min(GAMES_PER_TASK, games - first), validate
+        )
+        for first in range(0, games, GAMES_PER_TASK)
+    ]
+
+    stats = SimulationStats()
+    if workers < 2:
+        for task in tasks:
+            stats.merge(_simulate(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for task_stats in pool.map(_simulate, tasks):
+                stats.merge(task_stats)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', default=Engine.CASE.value, help='CASE, DUMMY, ...')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--win-length', type=int, help='marks in a row needed to win, the board size by default')
+    parser.add_argument('--policies', nargs=2, default=('random', 'random'), metavar=('FIRST', 'SECOND'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-validation', dest='validate', action='store_false')
+    parser.add_argument('--replay', type=int, metavar='SEED', help='replay the game played from SEED, move by move')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        engine = get_engine(args.engine, args.board_size)
+        result = play_game(
+            engine, (get_policy(args.policies[0]), get_policy(args.policies[1])), args.replay, args.validate, True,
+            args.win_length
+        )
+        print(f'{result.outcome} after {result.plies} plies, {result.collapses} collapses')
+        return
+
+    started_at = time.perf_counter()
+    stats = simulate(
+        args.engine, args.games, args.board_size, args.win_length, tuple(args.policies), args.seed, args.workers,
+        args.validate
+    )
+    print(stats.report(time.perf_counter() - started_at))
+
+
+if __name__ == '__main__':
+    main()
